@@ -0,0 +1,82 @@
+# alert_dedup.py
+"""
+Alert suppression: the same alert raised again within DEDUP_WINDOW seconds
+updates the existing alerts row (count + 1, last_seen) instead of adding
+a new one.
+
+An alert's fingerprint is a hash of (rule, ip, user, host, key) plus the
+time bucket it falls in (epoch // window), so "brute force from 10.0.0.5"
+collapses into one row per window. `key` is the detail that makes two
+alerts of one rule different, e.g. the flagged domain; it is not the
+free-text details, which often carry counts.
+
+The database enforces this (unique index on alerts.fingerprint, upsert in
+rules.INSERT_ALERT_SQL), so it holds across processes. The LRU in this
+module sits in front of that: it collapses repeats inside a write batch
+and keeps the console from printing the same [ALERT] line over and over.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEDUP_WINDOW = 3600  # seconds; repeats inside one window share a row
+DEDUP_CACHE_SIZE = 10000  # fingerprints remembered in memory (least recent evicted)
+
+
+def fingerprint(rule, ip=None, user=None, host=None, key=None, now=None, window=DEDUP_WINDOW):
+    bucket = int((time.time() if now is None else now) // window)
+    parts = (rule, ip or "", user or "", host or "", key or "", str(bucket))
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=12).hexdigest()
+
+
+class AlertSuppressor:
+    def __init__(self, max_entries=DEDUP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.seen = OrderedDict()  # fingerprint -> occurrences seen by this process
+        self.stats = {"new": 0, "repeats": 0, "evicted": 0}
+        # observe() runs on the rule scheduler's worker threads and the ingester's stream path
+        self.lock = threading.Lock()
+
+    def observe(self, fp):
+        """Count one occurrence; True the first time fp is seen (while it stays cached)."""
+        with self.lock:
+            seen = self.seen
+            if fp in seen:
+                seen[fp] += 1
+                seen.move_to_end(fp)
+                self.stats["repeats"] += 1
+                return False
+            seen[fp] = 1
+            self.stats["new"] += 1
+            if len(seen) > self.max_entries:
+                seen.popitem(last=False)
+                self.stats["evicted"] += 1
+            return True
+
+    def report(self, tag):
+        with self.lock:
+            s = dict(self.stats)
+            cached = len(self.seen)
+        if s["new"] or s["repeats"]:
+            print(
+                f"[{tag}] alert dedup: new={s['new']} suppressed={s['repeats']} "
+                f"cached={cached} evicted={s['evicted']}"
+            )
+
+
+SUPPRESSOR = AlertSuppressor()
+
+
+def collapse(rows):
+    """Merge alert_row() tuples with the same fingerprint (count summed, last_seen kept)."""
+    merged = OrderedDict()
+    for row in rows:
+        fp = row[7]
+        prev = merged.get(fp)
+        if prev is None:
+            merged[fp] = row
+        else:
+            merged[fp] = prev[:6] + (row[6], fp, prev[8] + row[8], row[9])
+    return list(merged.values())
@@ -0,0 +1,65 @@
+# api_json.py
+"""
+JSON encoding for the dashboard API (main.py, live_feed.py).
+
+Query rows go straight from SQLite tuples to response bytes, without
+FastAPI's encoder walking them a second time. orjson is used when it is
+installed (pip install orjson). Without it, the json module with compact
+separators: object rows are filled into one prebuilt template per page
+instead of building a dict per row, which keeps it faster than the
+dict + json.dumps handlers it replaced. It escapes non-ASCII text where
+orjson writes UTF-8; both decode to the same values.
+
+Two shapes:
+  rows     [{"id": 1, "time": ...}, ...]   (default)
+  columns  {"id": [1, 2, ...], "time": [...], ...}
+           smaller and cheaper to build for big pages; ?format=columns
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# output names of main.ALERT_COLUMNS / TIMELINE_COLUMNS, in the same order
+ALERT_FIELDS = ("id", "time", "rule", "severity", "ip", "user", "host", "details", "count", "last_seen")
+EVENT_FIELDS = ("id", "time", "host", "user", "action", "status", "ip", "url", "domain", "title")
+
+
+_escape = json.encoder.encode_basestring_ascii  # json's own string encoder (C)
+
+
+def dumps(obj):
+    """obj as compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def _value(v):
+    if v is None:
+        return "null"
+    if v.__class__ is int:
+        return int.__repr__(v)
+    return json.dumps(v)
+
+
+def _objects_json(fields, rows):
+    """json fallback for a list of objects: one template, values escaped a column at a time."""
+    if not rows:
+        return b"[]"
+    template = "{" + ",".join(json.dumps(f).replace("%", "%%") + ":%s" for f in fields) + "}"
+    cols = [[_escape(v) if v.__class__ is str else _value(v) for v in col] for col in zip(*rows)]
+    return ("[" + ",".join([template % values for values in zip(*cols)]) + "]").encode()
+
+
+def rows_json(fields, rows, columns=False):
+    """JSON bytes for result rows, as a list of objects or one list per field."""
+    if columns:
+        values = zip(*rows) if rows else ((),) * len(fields)
+        return dumps({field: list(col) for field, col in zip(fields, values)})
+    if orjson is None:
+        return _objects_json(fields, rows)
+    return orjson.dumps([dict(zip(fields, row)) for row in rows])
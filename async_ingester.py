@@ -0,0 +1,211 @@
+# async_ingester.py
+"""
+asyncio ingester: one event loop serving syslog over UDP (DatagramProtocol)
+and over TCP with RFC 6587 framing, so agents can keep a persistent stream
+open instead of sending one datagram per event.
+
+TCP frames may use octet counting ("<len> <msg>") or, for simple senders,
+newline-terminated messages (non-transparent framing); the first frame
+fixes the method for the connection. On close, an unterminated last line
+is still taken, but a partial octet-counted frame is a framing error.
+Parsed events go through the same BoundedQueue -> writer thread ->
+BatchWriter path as the threaded ingester.
+
+Run with:  python ingester.py --mode async
+"""
+
+import asyncio
+import threading
+
+from ingester import (
+    LISTEN_HOST,
+    LISTEN_PORT,
+    STATS_INTERVAL,
+    DEFAULT_QUEUE_SIZE,
+    BatchWriter,
+    BoundedQueue,
+    DETECTOR,
+    parse_log_line,
+    write_loop,
+)
+from stream_rules import StreamEngine
+
+TCP_PORT = LISTEN_PORT
+TCP_BACKLOG = 1024
+MAX_FRAME = 64 * 1024  # bytes; longer frames close the connection
+
+
+class IngestCounters:
+    def __init__(self):
+        self.datagrams = 0
+        self.frames = 0
+        self.parse_failed = 0
+        self.framing_errors = 0
+        self.connections = 0
+        self.connections_total = 0
+
+    def report(self):
+        print(
+            f"[INGESTER] async: udp={self.datagrams} tcp_frames={self.frames} "
+            f"connections={self.connections} (total {self.connections_total}) "
+            f"framing_errors={self.framing_errors} parse_failed={self.parse_failed}"
+        )
+
+
+def handle_message(data, source, parsed_q, counters):
+    line = data.decode('utf-8', errors='ignore').strip()
+    if not line:
+        return
+    parsed = parse_log_line(line, source)
+    if parsed:
+        parsed_q.put(parsed)
+    else:
+        counters.parse_failed += 1
+
+
+class SyslogDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, parsed_q, counters):
+        self.parsed_q = parsed_q
+        self.counters = counters
+
+    def datagram_received(self, data, addr):
+        self.counters.datagrams += 1
+        handle_message(data, addr[0], self.parsed_q, self.counters)
+
+    def error_received(self, exc):
+        print(f"[INGESTER] UDP error: {exc}")
+
+
+class SyslogStreamProtocol(asyncio.Protocol):
+    """One TCP connection; splits the byte stream into RFC 6587 frames."""
+
+    def __init__(self, parsed_q, counters):
+        self.parsed_q = parsed_q
+        self.counters = counters
+        self.buf = bytearray()
+        self.octet_counted = None  # framing of this connection, set by its first frame
+        self.transport = None
+        self.source = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info('peername')
+        self.source = peer[0] if peer else None
+        self.counters.connections += 1
+        self.counters.connections_total += 1
+
+    def connection_lost(self, exc):
+        self.counters.connections -= 1
+        if self.buf:
+            if self.octet_counted:
+                # shorter than its count said: truncated, not a message
+                self.counters.framing_errors += 1
+                print(f"[INGESTER] Framing error from {self.source}: "
+                      f"connection closed inside a frame ({len(self.buf)} bytes dropped)")
+            else:
+                # a sender that closes without a trailing newline still meant it
+                self.counters.frames += 1
+                handle_message(bytes(self.buf), self.source, self.parsed_q, self.counters)
+        self.buf.clear()
+
+    def data_received(self, data):
+        self.buf += data
+        try:
+            while True:
+                frame = self.next_frame()
+                if frame is None:
+                    break
+                self.counters.frames += 1
+                handle_message(frame, self.source, self.parsed_q, self.counters)
+        except ValueError as e:
+            self.counters.framing_errors += 1
+            print(f"[INGESTER] Framing error from {self.source}: {e}")
+            self.buf.clear()
+            self.transport.close()
+
+    def next_frame(self):
+        """Pop one complete frame off self.buf, or return None if incomplete."""
+        buf = self.buf
+        if not buf:
+            return None
+        if self.octet_counted is None:
+            # RFC 6587: one framing method per connection
+            self.octet_counted = buf[:1].isdigit()
+
+        if self.octet_counted:
+            # octet counting: MSG-LEN SP SYSLOG-MSG
+            sp = buf.find(b" ", 0, 8)
+            if sp == -1:
+                if len(buf) >= 8:
+                    raise ValueError("missing octet count")
+                return None
+            length = int(buf[:sp])
+            if length > MAX_FRAME:
+                raise ValueError(f"frame too long ({length} bytes)")
+            end = sp + 1 + length
+            if len(buf) < end:
+                return None
+            frame = bytes(buf[sp + 1:end])
+            del buf[:end]
+            return frame
+
+        # non-transparent framing: LF-terminated
+        nl = buf.find(b"\n")
+        if nl == -1:
+            if len(buf) > MAX_FRAME:
+                raise ValueError("unterminated frame too long")
+            return None
+        frame = bytes(buf[:nl])
+        del buf[:nl + 1]
+        return frame
+
+
+async def serve(parsed_q, counters):
+    loop = asyncio.get_running_loop()
+    udp_transport, _ = await loop.create_datagram_endpoint(
+        lambda: SyslogDatagramProtocol(parsed_q, counters),
+        local_addr=(LISTEN_HOST, LISTEN_PORT),
+    )
+    server = await loop.create_server(
+        lambda: SyslogStreamProtocol(parsed_q, counters),
+        LISTEN_HOST,
+        TCP_PORT,
+        backlog=TCP_BACKLOG,
+        reuse_address=True,
+    )
+    print(f"[INGESTER] Listening on {LISTEN_HOST}:{LISTEN_PORT}/udp and {LISTEN_HOST}:{TCP_PORT}/tcp (asyncio)")
+    try:
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            counters.report()
+            parsed_q.report("parsed queue")
+            DETECTOR.report()
+    finally:
+        udp_transport.close()
+        server.close()
+        await server.wait_closed()
+
+
+def run_async(queue_size=DEFAULT_QUEUE_SIZE, policy="drop-oldest", stream_rules=False):
+    """Run the event loop here and the SQLite writer on its own thread."""
+    if policy == "block":
+        # put() runs on the event loop thread; blocking it would stall every connection
+        raise ValueError("overflow policy 'block' is not supported in async mode")
+    parsed_q = BoundedQueue(queue_size, policy)
+    writer = BatchWriter(engine=StreamEngine() if stream_rules else None)
+    writer_thread = threading.Thread(target=write_loop, args=(parsed_q, writer), name="writer", daemon=True)
+    writer_thread.start()
+    counters = IngestCounters()
+
+    try:
+        asyncio.run(serve(parsed_q, counters))
+    except KeyboardInterrupt:
+        print("\n[INGESTER] Stopping, flushing pending rows...")
+    finally:
+        parsed_q.close()
+        writer_thread.join()
+        writer.report()
+
+
+if __name__ == "__main__":
+    run_async()
@@ -0,0 +1,223 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import api_json
+import threat_db
+from api_json import EVENT_FIELDS, rows_json
+from domain_matcher import DomainMatcher
+from ingester import parse_log_line
+from threat_intel import ThreatIndex, build_index
+from tokenizer import tokenize
+
+# Micro-benchmarks for hot paths. Each prints per-op cost; run before and
+# after a change on the same machine to compare.
+
+SAMPLE_LINES = [
+    "<13>2026-02-04T09:44:43 localhost chrome host=LAPTOP-ASUS user=bob "
+    "url=https://example.com/search?q=siem&page=2 title=Example action=browse status=success",
+    "<13>2026-02-04T09:44:43 localhost auth failed user=admin ip=192.168.1.100 action=login status=fail",
+    '<13>2026-02-04T09:44:43 localhost file user=bob path="C:\\Users\\bob\\My Documents\\report.docx" '
+    "access=read action=file_access status=success",
+    "<13>2026-02-04T09:44:43 localhost auth sudo user=root ip=10.0.0.5 status=success",
+]
+
+
+def timeit(label, fn, items, repeat=5):
+    """Run fn over items `repeat` times and print the best per-item time."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    per_op = best / len(items) * 1e6
+    print(f"{label:<40} {per_op:8.2f} us/op  {len(items) / best:12,.0f} ops/s")
+    return per_op
+
+
+# ingester's field parser before the tokenizer, the baseline for --tokenizer
+FIELD_RE = re.compile(r'(\w+)=(".*?"|\S+)')
+
+
+def legacy_parse(line):
+    """parse_log_line before the tokenizer: FIELD_RE.findall + split() timestamp."""
+    timestamp = datetime.now().isoformat()
+    if "localhost" in line:
+        try:
+            timestamp = line.split(">", 1)[1].split("localhost", 1)[0].strip()
+        except Exception:
+            pass
+    return timestamp, dict(FIELD_RE.findall(line))
+
+
+def bench_tokenizer(n=50000):
+    lines = (SAMPLE_LINES * (n // len(SAMPLE_LINES) + 1))[:n]
+    print(f"Tokenizer: {n} lines, {len(SAMPLE_LINES)} line shapes")
+    timeit("dict(FIELD_RE.findall()) only", lambda line: dict(FIELD_RE.findall(line)), lines)
+    old = timeit("FIELD_RE.findall + split (old)", legacy_parse, lines)
+    new = timeit("tokenize()", tokenize, lines)
+    timeit("parse_log_line()", parse_log_line, lines)
+    print(f"tokenize() speedup: {old / new:.2f}x")
+
+
+def synthetic_domains(n, seed=1):
+    rng = random.Random(seed)
+    tlds = ("com", "net", "org", "io", "xyz", "ru", "info")
+    return [
+        f"{rng.getrandbits(40):x}-{i}.{rng.choice(tlds)}" if i % 3 else f"cdn{i}.{rng.getrandbits(32):x}.{rng.choice(tlds)}"
+        for i in range(n)
+    ]
+
+
+def bench_threat_index(n=50000):
+    """Build an index from n domains + n/10 CIDRs + n/10 hashes; report size and lookup cost."""
+    domains = synthetic_domains(n)
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        feed_dir = os.path.join(tmp, "feeds")
+        os.mkdir(feed_dir)
+        with open(os.path.join(feed_dir, "domains.txt"), "w") as f:
+            f.writelines(f"{d}\n" for d in domains)
+        with open(os.path.join(feed_dir, "ips.txt"), "w") as f:
+            for _ in range(n // 10):
+                x = rng.getrandbits(24)
+                f.write(f"{x >> 16}.{(x >> 8) & 255}.{x & 255}.0/24\n")
+        with open(os.path.join(feed_dir, "hashes.csv"), "w") as f:
+            f.write("indicator,reason\n")
+            f.writelines(f"{hashlib.sha256(str(i).encode()).hexdigest()},sample\n" for i in range(n // 10))
+
+        index_path = os.path.join(tmp, "threat_index.bin")
+        start = time.perf_counter()
+        build_index(feed_dir, index_path)
+        build_s = time.perf_counter() - start
+        size = os.path.getsize(index_path)
+
+        tracemalloc.start()
+        index = ThreatIndex(index_path)
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # the alternatives: the feed read into a dict, or compiled into DomainMatcher's trie
+        tracemalloc.start()
+        with open(os.path.join(feed_dir, "domains.txt")) as f:
+            as_dict = {line.strip(): "domains" for line in f}
+        dict_heap = tracemalloc.get_traced_memory()[0]
+        trie = DomainMatcher(as_dict)
+        trie_heap = tracemalloc.get_traced_memory()[0] - dict_heap
+        tracemalloc.stop()
+        del as_dict, trie
+
+        per_m = 1e6 / n
+        print(f"Threat index: {n:,} domains, {n // 10:,} CIDRs, {n // 10:,} sha256")
+        print(f"{'build':<40} {build_s:8.2f} s")
+        print(f"{'index file':<40} {size / 2**20:8.1f} MB  ({size / 2**20 * per_m:.1f} MB per million domains)")
+        print(f"{'Python heap after open':<40} {heap / 2**10:8.1f} KB")
+        print(f"{'same domains as a dict (heap)':<40} {dict_heap / 2**20:8.1f} MB  ({dict_heap / 2**20 * per_m:.1f} MB per million)")
+        print(f"{'same domains as a DomainMatcher (heap)':<40} {trie_heap / 2**20:8.1f} MB  ({trie_heap / 2**20 * per_m:.1f} MB per million)")
+
+        probes = min(n, 20000)
+        hits = [f"www.{d}" for d in rng.sample(domains, probes)]
+        misses = [f"www.clean{i}.example.com" for i in range(probes)]
+        ips = [f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}" for _ in range(probes)]
+        digests = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(probes)]
+        timeit("match_domain() hit (subdomain)", index.match_domain, hits)
+        timeit("match_domain() miss", index.match_domain, misses)
+        # what the prefilter saves: threat_db.match_domain() on clean domains,
+        # with it and with every suffix going to the trie and the index
+        threat_db.INTEL.index = index
+        timeit("prefilter might_match(), clean domain", threat_db.might_match, misses)
+        with_filter = timeit("match_domain() clean, prefiltered", threat_db.match_domain, misses)
+        matcher = threat_db.MATCHER
+        without = timeit(
+            "match_domain() clean, exact lookups",
+            lambda d: (matcher.domains.match(d), index.match_domain(d), matcher.match_url(d)),
+            misses,
+        )
+        threat_db.INTEL.index = None
+        print(f"{'prefilter saving':<40} {1 - with_filter / without:8.0%}")
+        fp = sum(".".join(reversed(d.split("."))) in index.bloom for d in misses) / len(misses)
+        print(f"{'bloom false-positive rate':<40} {fp:8.2%}  (target {index.fp_rate:.2%}, {len(index.bloom.bits) / 2**20:.1f} MB)")
+        timeit("match_ip()", index.match_ip, ips)
+        timeit("match_hash()", index.match_hash, digests)
+
+
+def timeline_rows(n, seed=3):
+    """n rows shaped like main.TIMELINE_COLUMNS."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        browse = i % 3 == 0
+        domain = f"site{rng.randrange(500)}.example.com" if browse else None
+        rows.append((
+            i + 1, f"2026-02-04T09:{i // 60 % 60:02d}:{i % 60:02d}", f"LAPTOP-{rng.randrange(20)}",
+            rng.choice(("alice", "bob", "carol")), "browse" if browse else "login",
+            rng.choice(("success", "fail")), f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+            f"https://{domain}/page/{i}" if browse else None, domain, f"Page {i}" if browse else None,
+        ))
+    return rows
+
+
+def legacy_timeline_json(rows):
+    """/timeline before api_json: a dict literal per row, then json.dumps."""
+    return json.dumps([
+        {
+            "id": id_,
+            "time": ts,
+            "host": host,
+            "user": user,
+            "action": action,
+            "status": status,
+            "ip": ip,
+            "url": url,
+            "domain": domain,
+            "title": title,
+        }
+        for id_, ts, host, user, action, status, ip, url, domain, title in rows
+    ], separators=(",", ":")).encode()
+
+
+def bench_json(pages=(100, 1000, 5000)):
+    """Cost of encoding one /timeline page, old path vs api_json."""
+    fast = api_json.orjson
+    print(f"JSON encoding per /timeline page (orjson {'installed' if fast else 'NOT installed'})")
+    for size in pages:
+        rows = timeline_rows(size)
+        items = [rows] * max(1, 20000 // size)
+        print(f"-- {size} rows: rows {len(rows_json(EVENT_FIELDS, rows)) / 1024:.0f} KB, "
+              f"columns {len(rows_json(EVENT_FIELDS, rows, True)) / 1024:.0f} KB")
+        old = timeit("dict per row + json.dumps (before)", legacy_timeline_json, items)
+        api_json.orjson = None
+        fallback = timeit("rows_json, json fallback", lambda r: rows_json(EVENT_FIELDS, r), items)
+        api_json.orjson = fast
+        print(f"json fallback speedup: {old / fallback:.1f}x")
+        if fast:
+            new = timeit("rows_json, orjson", lambda r: rows_json(EVENT_FIELDS, r), items)
+            cols = timeit("rows_json columns, orjson", lambda r: rows_json(EVENT_FIELDS, r, True), items)
+            print(f"speedup: rows {old / new:.1f}x, columns {old / cols:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokenizer', action='store_true', help="tokenize() vs FIELD_RE")
+    parser.add_argument('--threat-index', action='store_true', help="threat-intel index size and lookups")
+    parser.add_argument('--json', action='store_true', help="API response encoding (api_json)")
+    parser.add_argument('-n', type=int, default=50000, help="Items per benchmark")
+    args = parser.parse_args()
+
+    if args.tokenizer:
+        bench_tokenizer(args.n)
+    if args.threat_index:
+        bench_threat_index(args.n)
+    if args.json:
+        bench_json()
+    if not (args.tokenizer or args.threat_index or args.json):
+        print("Use: python bench.py --tokenizer | --threat-index | --json")
+        bench_tokenizer(args.n)
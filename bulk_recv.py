@@ -0,0 +1,211 @@
+# bulk_recv.py
+"""
+Bulk datagram receive for high event rates.
+
+Datagrams are read into one preallocated bytearray split into fixed-size
+slots, so receiving allocates nothing per event. Each wakeup drains as
+many datagrams as are queued (up to the pool size):
+  - Linux: a single recvmmsg() syscall via ctypes fills every slot at once
+  - elsewhere: recvfrom_into() in a non-blocking loop, one slot per datagram
+
+The parser decodes straight from the memoryview slices; the pool is reused
+on the next wakeup, so slices must not be kept past parsing.
+
+Run with:  python ingester.py --mode bulk
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import sys
+import threading
+import time
+
+from ingester import (
+    LISTEN_HOST,
+    LISTEN_PORT,
+    STATS_INTERVAL,
+    DEFAULT_QUEUE_SIZE,
+    BatchWriter,
+    BoundedQueue,
+    DETECTOR,
+    parse_log_line,
+    write_loop,
+)
+from stream_rules import StreamEngine
+
+POOL_SLOTS = 256  # datagrams per wakeup
+SLOT_SIZE = 4096  # max datagram size, same as recvfrom(4096)
+RCVBUF_BYTES = 8 * 1024 * 1024  # kernel buffer to ride out bursts between wakeups
+
+MSG_DONTWAIT = 0x40
+SOCKADDR_IN_SIZE = 16
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def load_recvmmsg():
+    """Return libc.recvmmsg, or None where it isn't available."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fn = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    fn.restype = ctypes.c_int
+    return fn
+
+
+class BulkReceiver:
+    """Fills a preallocated slot pool with as many datagrams as one wakeup allows."""
+
+    def __init__(self, sock, slots=POOL_SLOTS, slot_size=SLOT_SIZE, use_recvmmsg=True):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.buf = bytearray(slots * slot_size)
+        view = memoryview(self.buf)
+        self.views = [view[i * slot_size:(i + 1) * slot_size] for i in range(slots)]
+        self.stats = {"wakeups": 0, "syscalls": 0, "datagrams": 0, "max_batch": 0}
+
+        self.recvmmsg = load_recvmmsg() if use_recvmmsg else None
+        if self.recvmmsg:
+            # point one iovec per slot into self.buf; the kernel writes there directly
+            base = ctypes.addressof((ctypes.c_char * len(self.buf)).from_buffer(self.buf))
+            self.iovecs = (iovec * slots)()
+            self.msgs = (mmsghdr * slots)()
+            # one sockaddr_in per slot for the sender address
+            self.names = (ctypes.c_char * (SOCKADDR_IN_SIZE * slots))()
+            names = ctypes.addressof(self.names)
+            for i in range(slots):
+                self.iovecs[i].iov_base = base + i * slot_size
+                self.iovecs[i].iov_len = slot_size
+                self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+                self.msgs[i].msg_hdr.msg_iovlen = 1
+                self.msgs[i].msg_hdr.msg_name = names + i * SOCKADDR_IN_SIZE
+
+    def receive(self, timeout):
+        """Wait up to timeout seconds; return (memoryview slice, sender ip) per datagram."""
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return []
+        self.stats["wakeups"] += 1
+        if self.recvmmsg:
+            batch = self._recvmmsg()
+        else:
+            batch = self._recv_into()
+        self.stats["datagrams"] += len(batch)
+        if len(batch) > self.stats["max_batch"]:
+            self.stats["max_batch"] = len(batch)
+        return batch
+
+    def _recvmmsg(self):
+        self.stats["syscalls"] += 1
+        for i in range(self.slots):
+            self.msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN_SIZE
+        n = self.recvmmsg(self.sock.fileno(), self.msgs, self.slots, MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, f"recvmmsg failed: {errno.errorcode.get(err, err)}")
+        names = self.names.raw
+        return [
+            (
+                self.views[i][:self.msgs[i].msg_len],
+                # sockaddr_in: family(2) port(2) addr(4)
+                socket.inet_ntoa(names[i * SOCKADDR_IN_SIZE + 4:i * SOCKADDR_IN_SIZE + 8]),
+            )
+            for i in range(n)
+        ]
+
+    def _recv_into(self):
+        batch = []
+        for view in self.views:
+            self.stats["syscalls"] += 1
+            try:
+                n, addr = self.sock.recvfrom_into(view)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((view[:n], addr[0]))
+        return batch
+
+    def report(self):
+        s = self.stats
+        per_wakeup = s["datagrams"] / s["wakeups"] if s["wakeups"] else 0.0
+        print(
+            f"[INGESTER] bulk recv ({'recvmmsg' if self.recvmmsg else 'recvfrom_into'}): "
+            f"datagrams={s['datagrams']} wakeups={s['wakeups']} syscalls={s['syscalls']} "
+            f"per_wakeup={per_wakeup:.1f} max_batch={s['max_batch']}"
+        )
+        s["max_batch"] = 0
+
+
+def run_bulk(queue_size=DEFAULT_QUEUE_SIZE, policy="drop-oldest", stream_rules=False):
+    """Receive + parse on this thread in pool-sized batches; write on a writer thread."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_BYTES)
+    sock.bind((LISTEN_HOST, LISTEN_PORT))
+    receiver = BulkReceiver(sock)
+
+    parsed_q = BoundedQueue(queue_size, policy)
+    writer = BatchWriter(engine=StreamEngine() if stream_rules else None)
+    writer_thread = threading.Thread(target=write_loop, args=(parsed_q, writer), name="writer", daemon=True)
+    writer_thread.start()
+
+    print(f"[INGESTER] Listening on {LISTEN_HOST}:{LISTEN_PORT} (bulk, {receiver.slots} slots per wakeup)")
+    next_report = time.monotonic() + STATS_INTERVAL
+    try:
+        while True:
+            for view, source in receiver.receive(writer.max_delay):
+                # decode directly from the pool slot; this str is the only copy
+                line = str(view, 'utf-8', 'ignore').strip()
+                try:
+                    parsed = parse_log_line(line, source)
+                except Exception as e:
+                    print(f"[INGESTER] Parse error: {e}")
+                    continue
+                if parsed:
+                    parsed_q.put(parsed)
+                else:
+                    print(f"[INGEST] Parse failed: {line[:70]}")
+
+            if time.monotonic() >= next_report:
+                receiver.report()
+                parsed_q.report("parsed queue")
+                DETECTOR.report()
+                writer.report()
+                next_report = time.monotonic() + STATS_INTERVAL
+    except KeyboardInterrupt:
+        print("\n[INGESTER] Stopping, flushing pending rows...")
+    finally:
+        sock.close()
+        parsed_q.close()
+        writer_thread.join()
+
+
+if __name__ == "__main__":
+    run_bulk()
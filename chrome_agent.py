@@ -17,6 +17,14 @@ UDP_HOST = "127.0.0.1"
 UDP_PORT = 514
 DEVICE_NAME = "LAPTOP-ASUS"
 
+# "udp": one datagram per event (works with every ingester mode)
+# "tcp": one persistent stream with RFC 6587 octet-counting framing
+#        (needs `python ingester.py --mode async`)
+TRANSPORT = "udp"
+TCP_PORT = 514
+
+_tcp_sock = None
+
 def get_chrome_history_path():
     """Find Chrome History DB for current user."""
     username = getpass.getuser()
@@ -35,14 +43,34 @@ def copy_chrome_history(src):
         print(f"[CHROME] Error copying History: {e}")
         return None
 
+def send_tcp(payload: bytes):
+    """Send one octet-counted frame on the persistent TCP stream, reconnecting once on failure."""
+    global _tcp_sock
+    frame = str(len(payload)).encode() + b" " + payload
+    for attempt in range(2):
+        try:
+            if _tcp_sock is None:
+                _tcp_sock = socket.create_connection((UDP_HOST, TCP_PORT), timeout=5)
+            _tcp_sock.sendall(frame)
+            return
+        except OSError:
+            if _tcp_sock is not None:
+                _tcp_sock.close()
+                _tcp_sock = None
+            if attempt:
+                raise
+
 def send_event(line: str):
-    """Send a syslog‑style line via UDP to ingester."""
+    """Send a syslog‑style line to ingester (UDP datagram or TCP stream, see TRANSPORT)."""
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
         msg = f"<13>{timestamp} localhost {line}"
-        s.sendto(msg.encode(), (UDP_HOST, UDP_PORT))
-        s.close()
+        if TRANSPORT == "tcp":
+            send_tcp(msg.encode())
+        else:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.sendto(msg.encode(), (UDP_HOST, UDP_PORT))
+            s.close()
         print(f"[CHROME] Sent: {line[:80]}...")
     except Exception as e:
         print(f"[CHROME] Error sending event: {e}")
@@ -0,0 +1,210 @@
+# db.py
+"""
+Shared SQLite connection factory for every component (ingester, rules,
+dashboard, init_db).
+
+All connections get the same settings:
+  journal_mode=WAL     readers (dashboard, rule scans) no longer block the
+                       ingester's writes and vice versa
+  synchronous=NORMAL   fsync at checkpoints instead of every commit (safe in WAL)
+  cache_size / mmap_size / temp_store  bigger page cache, mmap'd reads
+  busy_timeout         writers wait up to BUSY_TIMEOUT_MS for the write lock
+
+connect_readonly() opens a mode=ro connection for readers that must never
+write (rule scans). READ_POOL keeps up to READ_POOL_SIZE of them open for
+the dashboard's request handlers, so requests share warm page caches
+instead of opening a connection each; pool_stats() shows how often a
+request had to wait for one.
+
+Writers should wrap their writes in write_transaction(conn). It takes the
+write lock up front with BEGIN IMMEDIATE and records how long that took,
+which is exactly the time spent waiting on other writers. lock_report()
+prints those numbers.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+DB_PATH = "logs.db"
+
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 32 * 1024  # per connection
+MMAP_SIZE = 256 * 1024 * 1024
+
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size={MMAP_SIZE}",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+
+# lock waits seen by this process (each component runs in its own process)
+LOCK_STATS = {"transactions": 0, "waited": 0, "wait_ms": 0.0, "max_wait_ms": 0.0, "timeouts": 0}
+_stats_lock = threading.Lock()
+
+# a BEGIN IMMEDIATE that takes longer than this counts as having waited
+WAIT_THRESHOLD_MS = 1.0
+
+READ_POOL_SIZE = 8  # read-only connections shared by the dashboard
+POOL_TIMEOUT = 10.0  # seconds a request waits for a free connection
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect(db_path=DB_PATH, check_same_thread=True):
+    """Open a connection with the shared pragmas applied."""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=check_same_thread)
+    # WAL is persistent in the file; setting it again is a no-op
+    conn.execute("PRAGMA journal_mode=WAL")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def connect_readonly(db_path=DB_PATH, check_same_thread=True):
+    """Open a read-only (mode=ro, query_only) connection with the shared pragmas.
+
+    For scans that run next to the writers, e.g. the rule scheduler's workers.
+    """
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=check_same_thread)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.execute("PRAGMA query_only=1")
+    return conn
+
+
+class ReadPool:
+    """Read-only connections, opened on demand up to size and reused."""
+
+    def __init__(self, db_path=DB_PATH, size=READ_POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.opened = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.cond = threading.Condition()
+        self.counts = {"acquired": 0, "waited": 0, "wait_ms": 0.0, "max_wait_ms": 0.0,
+                       "max_in_use": 0, "max_waiting": 0, "timeouts": 0, "discarded": 0}
+
+    def _acquire(self):
+        with self.cond:
+            start = None
+            while not self.idle and self.opened >= self.size:
+                if start is None:
+                    start = time.perf_counter()
+                    self.waiting += 1
+                    self.counts["max_waiting"] = max(self.counts["max_waiting"], self.waiting)
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self.waiting -= 1
+                    self.counts["timeouts"] += 1
+                    raise PoolTimeout(f"no free read connection after {self.timeout:g}s")
+                self.cond.wait(remaining)
+            if start is not None:
+                self.waiting -= 1
+                waited_ms = (time.perf_counter() - start) * 1000
+                self.counts["waited"] += 1
+                self.counts["wait_ms"] += waited_ms
+                self.counts["max_wait_ms"] = max(self.counts["max_wait_ms"], waited_ms)
+            self.in_use += 1
+            self.counts["acquired"] += 1
+            self.counts["max_in_use"] = max(self.counts["max_in_use"], self.in_use)
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        try:
+            return connect_readonly(self.db_path, check_same_thread=False)
+        except BaseException:
+            self._release(None)
+            raise
+
+    def _release(self, conn, discard=False):
+        """Return conn to the pool; None (never opened) or discard frees its slot."""
+        if discard:
+            conn.close()
+        with self.cond:
+            self.in_use -= 1
+            if conn is None or discard:
+                self.opened -= 1
+                self.counts["discarded"] += discard
+            else:
+                if conn.in_transaction:
+                    conn.rollback()
+                self.idle.append(conn)
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            # a broken connection is not handed out again
+            self._release(conn, discard=True)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        self._release(conn)
+
+    def stats(self):
+        with self.cond:
+            return dict(self.counts, size=self.size, open=self.opened,
+                        in_use=self.in_use, waiting=self.waiting)
+
+
+READ_POOL = ReadPool()
+
+
+@contextmanager
+def write_transaction(conn):
+    """BEGIN IMMEDIATE ... COMMIT, recording how long the write lock took to get."""
+    if conn.in_transaction:
+        # already inside someone's transaction; let them commit
+        yield conn
+        return
+
+    start = time.perf_counter()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError:
+        with _stats_lock:
+            LOCK_STATS["timeouts"] += 1
+        raise
+    waited_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        LOCK_STATS["transactions"] += 1
+        if waited_ms >= WAIT_THRESHOLD_MS:
+            LOCK_STATS["waited"] += 1
+            LOCK_STATS["wait_ms"] += waited_ms
+        if waited_ms > LOCK_STATS["max_wait_ms"]:
+            LOCK_STATS["max_wait_ms"] = waited_ms
+
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def lock_report(tag):
+    """Print this process's lock-wait numbers and reset the interval maximum."""
+    with _stats_lock:
+        s = LOCK_STATS
+        print(
+            f"[{tag}] lock waits: {s['waited']}/{s['transactions']} transactions "
+            f"waited total={s['wait_ms']:.1f}ms max={s['max_wait_ms']:.1f}ms "
+            f"timeouts={s['timeouts']}"
+        )
+        s["max_wait_ms"] = 0.0
@@ -0,0 +1,147 @@
+# domain_matcher.py
+"""
+Compiled matcher for threat-feed indicators.
+
+Indicators are split in two when the matcher is built:
+  - plain domains ("malware.com") go into a reversed-label trie and match
+    that domain and any subdomain of it ("cdn.malware.com"), but not
+    look-alikes that merely contain it ("notmalware.com")
+  - anything else (URLs, paths, fragments like "https://chatgpt.com/") goes
+    into an Aho-Corasick automaton and is matched as a substring of the
+    full URL
+
+A lookup walks the domain's labels once and the URL's characters once,
+so its cost depends on the input length, not on the number of indicators.
+A matcher is immutable once built; to change the feed, build a new one
+and swap the reference (see threat_db.reload).
+
+`hosts` holds the plain domain indicators, the only ones the trie can
+match, for threat_db's prefilter. URL indicators are always searched.
+"""
+
+import re
+
+# a "plain domain" indicator: labels of letters/digits/hyphens/underscores
+DOMAIN_RE = re.compile(r"^(?:[a-z0-9_-]+\.)*[a-z0-9_-]+$")
+
+_END = ""  # trie key holding the (indicator, value) stored at a node; never a real label
+
+
+class DomainTrie:
+    """Reversed-label trie: com -> malware -> cdn ..."""
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def add(self, domain, value):
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = (domain, value)
+
+    def match(self, domain):
+        """Return [(indicator, value)] for domain itself and every listed parent domain."""
+        hits = []
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            hit = node.get(_END)
+            if hit is not None:
+                hits.append(hit)
+        return hits
+
+
+class AhoCorasick:
+    """Multi-pattern substring search in one pass over the text."""
+
+    def __init__(self, patterns):
+        # node i: goto[i] (char -> node), fail[i], out[i] (list of (pattern, value))
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._build()
+
+    def _add(self, pattern, value):
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((pattern, value))
+
+    def _build(self):
+        queue = list(self.goto[0].values())
+        for node in queue:  # breadth-first; queue grows while iterating
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def search(self, text):
+        hits = []
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                hits.extend(out[node])
+        return hits
+
+    def __len__(self):
+        return sum(1 for o in self.out if o)
+
+
+class DomainMatcher:
+    """Domain trie + URL substring automaton built from {indicator: value}."""
+
+    def __init__(self, indicators):
+        self.domains = DomainTrie()
+        substrings = []
+        hosts = set()
+        for indicator, value in indicators.items():
+            key = indicator.strip().lower()
+            if not key:
+                continue
+            if DOMAIN_RE.match(key):
+                key = key.strip(".")
+                self.domains.add(key, value)
+                hosts.add(key)
+            else:
+                substrings.append((key, value))
+        self.substrings = AhoCorasick(substrings)
+        self.has_substrings = bool(substrings)
+        self.hosts = frozenset(hosts)
+
+    def match(self, domain, url=None):
+        """Return [(indicator, value)] hits for a domain (and its full URL, if given)."""
+        hits = self.domains.match(domain.lower().rstrip(".")) if domain else []
+        hits.extend(self.match_url(domain, url, hits))
+        return hits
+
+    def match_url(self, domain, url=None, hits=()):
+        """[(indicator, value)] for URL indicators found in url (or domain), minus hits."""
+        if not self.has_substrings:
+            return []
+        text = (url or domain or "").lower()
+        if not text:
+            return []
+        seen = {indicator for indicator, _ in hits}
+        return [hit for hit in dict.fromkeys(self.substrings.search(text)) if hit[0] not in seen]
@@ -101,13 +101,21 @@ if __name__ == "__main__":
 '''
 
 # ingester.py - FINAL FIXED VERSION
+import argparse
 import socket
 import json
 import sqlite3
-import re
-from datetime import datetime
+import threading
+import time
+from collections import deque
+
+from db import DB_PATH, connect, lock_report, write_transaction
+from migrations import migrate
+from parsers import FormatDetector
+from alert_dedup import SUPPRESSOR
+from rules import advance_cursors, alert_row, announce, run_rules_once, write_alerts
+from stream_rules import StreamEngine, event_from_row
 
-DB_PATH = "logs.db"
 LISTEN_HOST = "0.0.0.0"
 LISTEN_PORT = 514
 
@@ -175,78 +183,445 @@ def parse_log_line(line: str) -> dict | None:
         "raw":       line,
     }
 '''
-FIELD_RE = re.compile(r'(\w+)=(".*?"|\S+)')
 
-def parse_log_line(line: str):
-    timestamp = datetime.now().isoformat()
-    if "localhost" in line:
-        try:
-            ts = line.split(">",1)[1].split("localhost",1)[0].strip()
-            timestamp = ts
-        except:
-            pass
+# one detector for the whole process: caches the log format per source address
+DETECTOR = FormatDetector()
 
-    fields = dict(FIELD_RE.findall(line))
+def parse_log_line(line: str, source=None):
+    """Parse a line in any registered format (see parsers.py); source is the sender's IP."""
+    return DETECTOR.parse(line, source)
 
-    return {
-        "timestamp": timestamp,
-        "host": fields.get("host","unknown"),
-        "user": fields.get("user","unknown"),
-        "action": fields.get("action","unknown"),
-        "status": fields.get("status","unknown"),
-        "ip": fields.get("ip","-"),
-        "url": fields.get("url"),
-        "title": fields.get("title"),
-        "raw": line,
-    }
+
+INSERT_LOG_SQL = """
+    INSERT INTO logs (timestamp, host, user, action, status, ip, url, domain, title, rawjson)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Batched writes: flush when this many rows are pending or the oldest
+# pending row has waited this long, whichever comes first.
+BATCH_MAX_ROWS = 1000
+BATCH_MAX_DELAY = 0.05  # seconds
+STATS_INTERVAL = 10  # seconds between [INGESTER] stats lines
+
+# Threaded pipeline: recv thread -> parser threads -> writer thread
+DEFAULT_PARSERS = 2
+DEFAULT_QUEUE_SIZE = 50000
+OVERFLOW_POLICIES = ("drop-oldest", "drop-newest", "block")
+
+
+def log_row(data: dict):
+    """Turn a parsed event into the tuple INSERT_LOG_SQL expects."""
+    return (
+        data["timestamp"],
+        data["host"],
+        data["user"],
+        data["action"],
+        data["status"],
+        data["ip"],
+        data.get("url"),
+        data.get("domain"),
+        data.get("title"),
+        json.dumps({"raw": data.get("raw")}),
+    )
 
 
 def insert_log(data: dict):
+    """One-off insert of a single event (the ingester itself uses BatchWriter)."""
     try:
-        conn = sqlite3.connect(DB_PATH, timeout=5)
-        conn.execute(
-            """
-            INSERT INTO logs (timestamp, host, user, action, status, ip, rawjson)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                data["timestamp"],
-                data["host"],
-                data["user"],
-                data["action"],
-                data["status"],
-                data["ip"],
-                json.dumps({
-                    "url": data.get("url"),
-                    "title": data.get("title"),
-                    "raw": data.get("raw"),
-                }),
-            ),
-        )
-        conn.commit()
+        conn = connect(DB_PATH)
+        with write_transaction(conn):
+            conn.execute(INSERT_LOG_SQL, log_row(data))
         conn.close()
     except Exception as e:
         print("[INGEST] DB Error:", e)
 
 
-def main():
-    """Listen for syslog messages."""
+class BatchWriter:
+    """Keeps one connection open and writes events in executemany batches.
+
+    add() queues a parsed event; the batch is written in a single
+    transaction once max_rows are pending or the oldest pending row is
+    older than max_delay seconds (checked by add() and flush_if_due()).
+
+    With a StreamEngine, every event is run through the streaming rules as
+    it is added and the resulting alerts are committed with the batch.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_rows=BATCH_MAX_ROWS, max_delay=BATCH_MAX_DELAY, engine=None):
+        self.conn = connect(db_path, check_same_thread=False)
+        self.engine = engine
+        self.pending_alerts = []
+        if engine:
+            # let the polling rules finish whatever was ingested before the
+            # stream started; from here on the engine sees every new row
+            run_rules_once(self.conn)
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        # rows that failed to commit are retried, but never more than this
+        self.max_pending = max_rows * 10
+        self.pending = []
+        self.oldest = None
+        self.lock = threading.Lock()
+        self.stats = {
+            "rows": 0,
+            "flushes": 0,
+            "errors": 0,
+            "dropped": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "max_queue_depth": 0,
+        }
+
+    def add(self, data: dict):
+        alerts = self.engine.process(data) if self.engine else ()
+        self._queue([log_row(data)], alerts)
+
+    def add_rows(self, rows):
+        """Queue already-built log_row() tuples (e.g. from ingester worker processes)."""
+        alerts = []
+        if self.engine:
+            for row in rows:
+                alerts.extend(self.engine.process(event_from_row(row)))
+        self._queue(rows, alerts)
+
+    def _queue(self, rows, alerts):
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.extend(rows)
+            for alert in alerts:
+                row = alert_row(**alert)
+                announce(row)
+                self.pending_alerts.append(row)
+            if len(self.pending) > self.stats["max_queue_depth"]:
+                self.stats["max_queue_depth"] = len(self.pending)
+            if len(self.pending) >= self.max_rows:
+                self._flush()
+
+    def due(self):
+        return bool(self.pending) and time.monotonic() - self.oldest >= self.max_delay
+
+    def flush_if_due(self):
+        with self.lock:
+            if self.due():
+                self._flush()
+
+    def flush(self):
+        """Write everything pending; returns the ids of the alerts written with it."""
+        with self.lock:
+            return self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return []
+        batch = self.pending
+        alerts = self.pending_alerts
+        alert_ids = []
+        start = time.perf_counter()
+        try:
+            with write_transaction(self.conn):
+                self.conn.executemany(INSERT_LOG_SQL, batch)
+                if self.engine:
+                    if alerts:
+                        alert_ids = write_alerts(self.conn, alerts)
+                    advance_cursors(self.conn, self.engine.rule_names)
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            print(f"[INGEST] DB Error ({len(batch)} rows pending): {e}")
+            if len(batch) > self.max_pending:
+                overflow = len(batch) - self.max_pending
+                del batch[:overflow]
+                self.stats["dropped"] += overflow
+            return []
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.pending = []
+        self.pending_alerts = []
+        self.oldest = None
+        self.stats["rows"] += len(batch)
+        self.stats["flushes"] += 1
+        self.stats["last_flush_ms"] = elapsed_ms
+        self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], elapsed_ms)
+        return alert_ids
+
+    def queue_depth(self):
+        return len(self.pending)
+
+    def report(self):
+        """Print flush latency / queue depth and reset the interval maxima."""
+        with self.lock:
+            s = self.stats
+            print(
+                f"[INGESTER] rows={s['rows']} flushes={s['flushes']} "
+                f"errors={s['errors']} dropped={s['dropped']} "
+                f"queue={len(self.pending)} max_queue={s['max_queue_depth']} "
+                f"last_flush={s['last_flush_ms']:.1f}ms max_flush={s['max_flush_ms']:.1f}ms"
+            )
+            s["max_flush_ms"] = 0.0
+            s["max_queue_depth"] = len(self.pending)
+            if self.engine:
+                self.engine.report()
+                SUPPRESSOR.report("RULES")
+        lock_report("INGESTER")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class BoundedQueue:
+    """Fixed-size FIFO between pipeline stages with an explicit overload policy.
+
+    policy decides what put() does when the queue is full:
+      drop-oldest  - evict the oldest queued item to make room
+      drop-newest  - discard the item being put
+      block        - wait until a consumer makes room
+    Every outcome is counted in self.stats.
+    """
+
+    def __init__(self, maxsize, policy="drop-oldest"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.closed = False
+        self.stats = {
+            "put": 0,
+            "dropped_oldest": 0,
+            "dropped_newest": 0,
+            "blocked": 0,
+            "max_depth": 0,
+        }
+
+    def put(self, item):
+        """Queue item; returns False if it was discarded."""
+        with self.lock:
+            if len(self.items) >= self.maxsize:
+                if self.policy == "drop-newest":
+                    self.stats["dropped_newest"] += 1
+                    return False
+                if self.policy == "drop-oldest":
+                    self.items.popleft()
+                    self.stats["dropped_oldest"] += 1
+                else:
+                    self.stats["blocked"] += 1
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.not_full.wait()
+                    if self.closed:
+                        return False
+            self.items.append(item)
+            self.stats["put"] += 1
+            if len(self.items) > self.stats["max_depth"]:
+                self.stats["max_depth"] = len(self.items)
+            self.not_empty.notify()
+            return True
+
+    def get_many(self, max_items, timeout=None):
+        """Return up to max_items queued items, or [] on timeout / close."""
+        with self.lock:
+            if not self.items and not self.closed:
+                self.not_empty.wait(timeout)
+            batch = []
+            while self.items and len(batch) < max_items:
+                batch.append(self.items.popleft())
+            if batch:
+                self.not_full.notify_all()
+            return batch
+
+    def close(self):
+        """Wake all waiters; get_many() keeps draining what is left."""
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def drained(self):
+        with self.lock:
+            return self.closed and not self.items
+
+    def depth(self):
+        return len(self.items)
+
+    def report(self, name):
+        with self.lock:
+            s = self.stats
+            print(
+                f"[INGESTER] {name}: depth={len(self.items)}/{self.maxsize} "
+                f"max_depth={s['max_depth']} put={s['put']} "
+                f"dropped_oldest={s['dropped_oldest']} "
+                f"dropped_newest={s['dropped_newest']} blocked={s['blocked']}"
+            )
+            s["max_depth"] = len(self.items)
+
+
+def bind_socket():
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((LISTEN_HOST, LISTEN_PORT))
-    print(f"[INGESTER] Listening on {LISTEN_HOST}:{LISTEN_PORT}")
-    
-    while True:
+    return sock
+
+
+def receive_loop(sock, raw_q, stop):
+    """Receive stage: only drains the socket, so SQLite waits never stall it."""
+    sock.settimeout(0.2)
+    while not stop.is_set():
         try:
             data, addr = sock.recvfrom(4096)
-            line = data.decode('utf-8', errors='ignore').strip()
-            
-            parsed = parse_log_line(line)
-            if parsed:
-                insert_log(parsed)
-            else:
-                print(f"[INGEST] Parse failed: {line[:70]}")
-        except Exception as e:
-            print(f"[INGESTER] Error: {e}")
+        except socket.timeout:
+            continue
+        except OSError as e:
+            if stop.is_set():
+                break
+            print(f"[INGESTER] Receive error: {e}")
+            continue
+        raw_q.put((data, addr[0]))
+
+
+def parse_loop(raw_q, parsed_q):
+    """Parser stage: decode + parse raw datagrams until raw_q is closed."""
+    while not raw_q.drained():
+        for data, source in raw_q.get_many(256, timeout=0.2):
+            try:
+                line = data.decode('utf-8', errors='ignore').strip()
+                parsed = parse_log_line(line, source)
+                if parsed:
+                    parsed_q.put(parsed)
+                else:
+                    print(f"[INGEST] Parse failed: {line[:70]}")
+            except Exception as e:
+                print(f"[INGESTER] Parse error: {e}")
+
+
+def write_loop(parsed_q, writer):
+    """Writer stage: the only thread that touches the database."""
+    while True:
+        batch = parsed_q.get_many(writer.max_rows, timeout=writer.max_delay)
+        for parsed in batch:
+            writer.add(parsed)
+        writer.flush_if_due()
+        if not batch and parsed_q.drained():
+            break
+    writer.close()
+
+
+def run_threaded(parsers=DEFAULT_PARSERS, queue_size=DEFAULT_QUEUE_SIZE, policy="drop-oldest", stream_rules=False):
+    """Receive thread -> bounded queue -> parser threads -> bounded queue -> writer thread."""
+    sock = bind_socket()
+    stop = threading.Event()
+    raw_q = BoundedQueue(queue_size, policy)
+    parsed_q = BoundedQueue(queue_size, policy)
+    writer = BatchWriter(engine=StreamEngine() if stream_rules else None)
+
+    receiver = threading.Thread(target=receive_loop, args=(sock, raw_q, stop), name="recv", daemon=True)
+    parser_threads = [
+        threading.Thread(target=parse_loop, args=(raw_q, parsed_q), name=f"parse-{i}", daemon=True)
+        for i in range(parsers)
+    ]
+    writer_thread = threading.Thread(target=write_loop, args=(parsed_q, writer), name="writer", daemon=True)
+    for t in [receiver, *parser_threads, writer_thread]:
+        t.start()
+
+    print(
+        f"[INGESTER] Listening on {LISTEN_HOST}:{LISTEN_PORT} "
+        f"(parsers={parsers} queue={queue_size} overflow={policy})"
+    )
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            raw_q.report("raw queue")
+            parsed_q.report("parsed queue")
+            DETECTOR.report()
+            writer.report()
+    except KeyboardInterrupt:
+        print("\n[INGESTER] Stopping, flushing pending rows...")
+    finally:
+        # shut stages down front to back so every queued event gets written
+        stop.set()
+        receiver.join()
+        sock.close()
+        raw_q.close()
+        for t in parser_threads:
+            t.join()
+        parsed_q.close()
+        writer_thread.join()
+
+
+def run_serial(stream_rules=False):
+    """Single-threaded loop: recvfrom, parse and write in series."""
+    sock = bind_socket()
+    # wake up at least once per batch window so time-based flushes happen
+    # even when traffic stops
+    sock.settimeout(BATCH_MAX_DELAY)
+    writer = BatchWriter(engine=StreamEngine() if stream_rules else None)
+    next_report = time.monotonic() + STATS_INTERVAL
+    print(f"[INGESTER] Listening on {LISTEN_HOST}:{LISTEN_PORT}")
+
+    try:
+        while True:
+            try:
+                data, addr = sock.recvfrom(4096)
+                line = data.decode('utf-8', errors='ignore').strip()
+
+                parsed = parse_log_line(line, addr[0])
+                if parsed:
+                    writer.add(parsed)
+                else:
+                    print(f"[INGEST] Parse failed: {line[:70]}")
+            except socket.timeout:
+                pass
+            except Exception as e:
+                print(f"[INGESTER] Error: {e}")
+
+            writer.flush_if_due()
+            if time.monotonic() >= next_report:
+                DETECTOR.report()
+                writer.report()
+                next_report = time.monotonic() + STATS_INTERVAL
+    except KeyboardInterrupt:
+        print("\n[INGESTER] Stopping, flushing pending rows...")
+    finally:
+        writer.close()
+        sock.close()
+
+
+def main():
+    """Listen for syslog messages."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['threaded', 'serial', 'async', 'multiproc', 'bulk'],
+                        default='threaded',
+                        help="threaded: recv/parse/write stages; serial: one loop; "
+                             "async: asyncio UDP + TCP (RFC 6587) listener; "
+                             "multiproc: SO_REUSEPORT worker processes + one writer process; "
+                             "bulk: recvmmsg/recv_into into a preallocated buffer pool")
+    parser.add_argument('--stream-rules', action='store_true',
+                        help="Run detection rules in-process on every event (see stream_rules.py)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for --mode multiproc (default: CPU count)")
+    parser.add_argument('--parsers', type=int, default=DEFAULT_PARSERS, help="Parser threads")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Capacity of each stage queue")
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default='drop-oldest',
+                        help="What to do when a stage queue is full")
+    args = parser.parse_args()
+
+    migrate()
+    if args.mode == 'serial':
+        run_serial(args.stream_rules)
+    elif args.mode == 'async':
+        if args.overflow == 'block':
+            parser.error("--overflow block is not supported with --mode async")
+        from async_ingester import run_async
+        run_async(args.queue_size, args.overflow, args.stream_rules)
+    elif args.mode == 'multiproc':
+        from multi_ingester import DEFAULT_WORKERS, run_multiproc
+        run_multiproc(args.workers or DEFAULT_WORKERS, args.stream_rules)
+    elif args.mode == 'bulk':
+        from bulk_recv import run_bulk
+        run_bulk(args.queue_size, args.overflow, args.stream_rules)
+    else:
+        run_threaded(args.parsers, args.queue_size, args.overflow, args.stream_rules)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+# live_feed.py
+"""
+Live updates for the dashboard (GET /stream in main.py, Server-Sent Events).
+
+One poller thread per dashboard process asks SQLite for rows past the last
+alert / log id it has seen, once per POLL_INTERVAL, and only while somebody
+is subscribed. Both are rowid range reads. Each batch is serialized to JSON
+once and handed to every subscriber's queue, so the database sees the same
+two small queries a second whether one analyst has the dashboard open or
+two hundred.
+
+A subscriber whose queue fills up (a stalled tab) misses messages; it gets
+a "resync" event instead and reloads the tables over the normal endpoints.
+
+Only new alert rows are pushed. A repeat that bumps count/last_seen on an
+existing alert (alert_dedup.py) shows up on the next reload.
+"""
+
+import asyncio
+import threading
+import time
+
+from api_json import ALERT_FIELDS, EVENT_FIELDS, rows_json
+from db import DB_PATH, connect_readonly
+
+POLL_INTERVAL = 1.0  # seconds between polls while anyone is subscribed
+LIVE_BATCH = 100  # newest rows sent per poll; the dashboard shows no more than that
+QUEUE_SIZE = 64  # messages buffered per subscriber before it is told to resync
+HEARTBEAT = 15  # seconds; keeps proxies from closing an idle stream
+
+ALERT_SQL = """
+    SELECT id, time, rule, severity, ip, user, host, details, count, last_seen
+    FROM alerts WHERE id > ? ORDER BY id DESC LIMIT ?
+"""
+
+EVENT_SQL = """
+    SELECT id, timestamp, host, user, action, status, ip, url, domain, title
+    FROM logs WHERE id > ? ORDER BY id DESC LIMIT ?
+"""
+
+RESYNC = "event: resync\ndata: {}\n\n"
+
+
+class Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.lagged = False
+
+    def offer(self, message):
+        """Runs on the subscriber's event loop."""
+        if self.lagged:
+            return
+        if self.queue.full():
+            self.lagged = True
+            return
+        self.queue.put_nowait(message)
+
+
+class LiveFeed:
+    def __init__(self, db_path=DB_PATH, interval=POLL_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.last_alert = None
+        self.last_event = None
+        self.counts = {"polls": 0, "alerts": 0, "events": 0, "messages": 0, "resyncs": 0}
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+            self.thread.start()
+
+    def subscribe(self):
+        sub = Subscriber(asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(sub)
+        self.wake.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    async def stream(self, sub):
+        """SSE text for one subscriber until the client goes away."""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if sub.lagged:
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sub.lagged = False
+                    self.counts["resyncs"] += 1
+                    yield RESYNC
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        with self.lock:
+            subscribers = len(self.subscribers)
+        return dict(self.counts, subscribers=subscribers, last_alert_id=self.last_alert,
+                    last_event_id=self.last_event)
+
+    def _run(self):
+        conn = None
+        while True:
+            with self.lock:
+                idle = not self.subscribers
+            if idle:
+                # nobody listening: no queries; start from "now" when someone comes back
+                self.last_alert = self.last_event = None
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            start = time.monotonic()
+            try:
+                if conn is None:
+                    conn = connect_readonly(self.db_path, check_same_thread=False)
+                self._poll(conn)
+            except Exception as e:
+                print(f"[LIVE] poll failed: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def _poll(self, conn):
+        self.counts["polls"] += 1
+        if self.last_alert is None:
+            self.last_alert = conn.execute("SELECT COALESCE(MAX(id), 0) FROM alerts").fetchone()[0]
+            self.last_event = conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+            return
+        alerts = conn.execute(ALERT_SQL, (self.last_alert, LIVE_BATCH)).fetchall()
+        events = conn.execute(EVENT_SQL, (self.last_event, LIVE_BATCH)).fetchall()
+        if alerts:
+            self.last_alert = alerts[0][0]
+            self.counts["alerts"] += len(alerts)
+            self._publish("alerts", ALERT_FIELDS, alerts)
+        if events:
+            self.last_event = events[0][0]
+            self.counts["events"] += len(events)
+            self._publish("events", EVENT_FIELDS, events)
+
+    def _publish(self, kind, fields, rows):
+        # newest first, like the /alerts and /timeline pages
+        message = f"event: {kind}\ndata: {rows_json(fields, rows).decode()}\n\n"
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, message)
+            except RuntimeError:
+                self.unsubscribe(sub)  # its event loop is gone
+        self.counts["messages"] += len(subscribers)
+
+
+LIVE = LiveFeed()
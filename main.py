@@ -177,124 +177,212 @@ def ui():
     </html>
     """
 '''
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
-import sqlite3
-import json
+import asyncio
+from typing import Literal
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
+
+from api_json import ALERT_FIELDS, EVENT_FIELDS, rows_json
+from db import READ_POOL, PoolTimeout
+from live_feed import LIVE
+from migrations import migrate
+from response_cache import CACHE
 
-DB_PATH = "logs.db"
 app = FastAPI(title="Mini SIEM")
 
 
-def get_conn():
-    return sqlite3.connect(DB_PATH)
+@app.on_event("startup")
+def apply_migrations():
+    migrate()
+    LIVE.start()
 
 
-@app.get("/alerts")
-def get_alerts(limit: int = 50):
+# Handlers are async; their SQLite work runs in worker threads
+# (asyncio.to_thread) on connections borrowed from db.READ_POOL, so the
+# event loop never blocks on a query and requests reuse warm connections.
+def run_read(fn):
+    """fn(conn) on a pooled read-only connection; 503 when the pool stays exhausted."""
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT time, rule, severity, ip, user, host, details
-            FROM alerts
-            ORDER BY time DESC
-            LIMIT ?
-            """,
-            (limit,),
-        )
-        rows = cur.fetchall()
-        conn.close()
-        return [
-            {
-                "time": r[0],
-                "rule": r[1],
-                "severity": r[2],
-                "ip": r[3],
-                "user": r[4],
-                "host": r[5],
-                "details": r[6],
-            }
-            for r in rows
-        ]
+        with READ_POOL.connection() as conn:
+            return fn(conn)
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+# Paging is keyset-based: each page is ORDER BY time DESC, id DESC and the
+# next one starts below the last row's (time, id), so SQLite seeks straight
+# to it in the (filter column, time) index however deep the page is.
+# Every filter is covered by an index from migration 7 and the queries are
+# in migrations.QUERY_PLAN_CHECKS.
+MAX_PAGE = 5000
+
+ALERT_COLUMNS = ("id", "time", "rule", "severity", "ip", "user", "host", "details", "count", "last_seen")
+TIMELINE_COLUMNS = ("id", "timestamp", "host", "user", "action", "status", "ip", "url", "domain", "title")
+
+
+def parse_cursor(cursor):
+    """'<time>|<id>' from a previous page's X-Next-Cursor header -> (time, id)."""
+    if not cursor:
+        return None
+    time_val, _, id_ = cursor.rpartition("|")
+    if not time_val or not id_.isdigit():
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    return time_val, int(id_)
+
+
+def fetch_page(conn, table, time_col, columns, filters, since, until, after, limit):
+    """One page of rows (newest first) plus the cursor for the next page, or None."""
+    where, params = [], []
+    for col, value in filters.items():
+        if value is not None:
+            where.append(f"{col} = ?")
+            params.append(value)
+    if since:
+        where.append(f"{time_col} >= ?")
+        params.append(since)
+    if until and not (after and after[0] < until):
+        # only the tighter upper bound: given both, SQLite may seek from
+        # `until` and walk every row down to the cursor
+        where.append(f"{time_col} < ?")
+        params.append(until)
+    if after:
+        where.append(f"({time_col}, id) < (?, ?)")
+        params.extend(after)
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {time_col} DESC, id DESC LIMIT ?"
+    rows = conn.execute(sql, (*params, limit)).fetchall()
+    next_cursor = f"{rows[-1][1]}|{rows[-1][0]}" if len(rows) == limit else None
+    return rows, next_cursor
+
+
+def cached_json(request, table, build, fields, columns=False):
+    """JSON response for build(conn) -> (rows, next_cursor), via CACHE.
+
+    Sends 304 when the client's If-None-Match is still current, the cached
+    body when this query was answered since table last changed, and only
+    otherwise runs build() and encodes its rows (api_json.rows_json).
+    """
+    key = f"{request.url.path}?{sorted(request.query_params.multi_items())}"
+    try:
+        version = CACHE.version(table)
+        etag = CACHE.etag(key, version)
+        if CACHE.not_modified(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        entry = CACHE.get(key, version)
+        if entry is None:
+            rows, next_cursor = run_read(build)
+            body = rows_json(fields, rows, columns)
+            entry = CACHE.put(key, version, body, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", **entry.headers}
+    return Response(entry.body, media_type="application/json", headers=headers)
 
 
+@app.get("/alerts")
+async def get_alerts(
+    request: Request,
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    cursor: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    severity: str | None = None,
+    rule: str | None = None,
+    user: str | None = None,
+    format: Literal["rows", "columns"] = "rows",
+):
+    """Newest alerts first; pass X-Next-Cursor back as ?cursor= for the next page."""
+    after = parse_cursor(cursor)
+
+    def build(conn):
+        return fetch_page(
+            conn, "alerts", "time", ALERT_COLUMNS,
+            {"severity": severity, "rule": rule, "user": user},
+            since, until, after, limit,
+        )
 
-@app.get("/timeline")
-def timeline(host: str | None = None, limit: int = 100):
-    """Return recent timeline entries with website metadata."""
-    try:
-        conn = get_conn()
-        cur = conn.cursor()
+    return await asyncio.to_thread(
+        cached_json, request, "alerts", build, ALERT_FIELDS, format == "columns"
+    )
 
-        if host:
-            cur.execute(
-                """
-                SELECT timestamp, host, user, action, status, ip, rawjson
-                FROM logs
-                WHERE host = ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-                """,
-                (host, limit),
-            )
-        else:
-            cur.execute(
-                """
-                SELECT timestamp, host, user, action, status, ip, rawjson
-                FROM logs
-                ORDER BY timestamp DESC
-                LIMIT ?
-                """,
-                (limit,),
-            )
 
-        rows = cur.fetchall()
-        conn.close()
 
-        timeline_entries = []
-        for ts, host_val, user, action, status, ip, rawjson in rows:
-            url = None
-            title = None
-            if rawjson:
-                try:
-                    data = json.loads(rawjson)
-                    url = (
-                        data.get("url")
-                        or data.get("page_url")
-                        or (data.get("request") or {}).get("url")
-                    )
-                    title = (
-                        data.get("title")
-                        or data.get("page_title")
-                        or (data.get("tab") or {}).get("title")
-                    )
-                except Exception:
-                    pass
-
-            timeline_entries.append(
-                {
-                    "time": ts,
-                    "host": host_val,
-                    "user": user,
-                    "action": action,
-                    "status": status,
-                    "ip": ip,
-                    "url": url,
-                    "title": title,
-                }
-            )
+@app.get("/rules")
+async def rule_stats():
+    """Per-rule scheduler statistics (written by rules.py after every run)."""
+    keys = ("rule", "last_id", "runs", "last_run", "last_ms", "max_ms", "last_rows",
+            "rows_scanned", "alerts", "timeouts", "overruns", "errors")
+
+    def build(conn):
+        rows = conn.execute(
+            """
+            SELECT rule, last_id, runs, last_run, last_ms, max_ms, last_rows,
+                   rows_scanned, alerts, timeouts, overruns, errors
+            FROM rule_state
+            ORDER BY rule
+            """
+        ).fetchall()
+        return [dict(zip(keys, r)) for r in rows]
 
-        return timeline_entries
+    try:
+        return await asyncio.to_thread(run_read, build)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/timeline")
+async def timeline(
+    request: Request,
+    host: str | None = None,
+    domain: str | None = None,
+    user: str | None = None,
+    action: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE),
+    format: Literal["rows", "columns"] = "rows",
+):
+    """Return timeline entries with website metadata, newest first, one page at a time."""
+    after = parse_cursor(cursor)
+
+    def build(conn):
+        return fetch_page(
+            conn, "logs", "timestamp", TIMELINE_COLUMNS,
+            {"host": host, "domain": domain.lower() if domain else None, "user": user, "action": action},
+            since, until, after, limit,
+        )
+
+    return await asyncio.to_thread(
+        cached_json, request, "logs", build, EVENT_FIELDS, format == "columns"
+    )
+
+
+@app.get("/stream")
+async def stream():
+    """Server-Sent Events: 'alerts' / 'events' batches (newest first) as rows arrive."""
+    sub = LIVE.subscribe()
+    return StreamingResponse(
+        LIVE.stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    return {"live": LIVE.stats(), "cache": CACHE.stats(), "read_pool": READ_POOL.stats()}
+
+
 @app.get("/", response_class=HTMLResponse)
-def ui():
+async def ui():
     return """
 <!DOCTYPE html>
 <html>
@@ -518,7 +606,7 @@ def ui():
       <div class="card">
         <div class="section-header">
           <h2 style="margin: 0;">Alerts</h2>
-          <small>Last 50 alerts</small>
+          <small>50 alerts per page</small>
         </div>
         <table>
           <thead>
@@ -535,14 +623,18 @@ def ui():
             <tr><td colspan="6" style="text-align:center; padding:12px;">Loading...</td></tr>
           </tbody>
         </table>
-        <p class="refresh-note">Auto-refreshes every 5 seconds.</p>
+        <p class="refresh-note">
+          <button class="pill" id="alerts-newer" onclick="newerAlerts()" disabled>&larr; Newer</button>
+          <button class="pill" id="alerts-older" onclick="olderAlerts()" disabled>Older &rarr;</button>
+          New alerts appear live on the newest page.
+        </p>
       </div>
 
       <!-- Timeline panel -->
       <div class="card">
         <div class="section-header">
           <h2 style="margin: 0;">User Timeline</h2>
-          <small>Last 100 events</small>
+          <small>100 events per page</small>
         </div>
         <table>
           <thead>
@@ -559,16 +651,33 @@ def ui():
             <tr><td colspan="6" style="text-align:center; padding:12px;">Loading...</td></tr>
           </tbody>
         </table>
-        <p class="refresh-note">Auto-refreshes every 5 seconds.</p>
+        <p class="refresh-note">
+          <button class="pill" id="timeline-newer" onclick="newerTimeline()" disabled>&larr; Newer</button>
+          <button class="pill" id="timeline-older" onclick="olderTimeline()" disabled>Older &rarr;</button>
+          New events appear live on the newest page.
+        </p>
       </div>
     </div>
   </div>
 
   <script>
+    // cursors of the pages walked through so far (null = newest page)
+    const alertPages = [null];
+    const timelinePages = [null];
+    let alertsNext = null;
+    let timelineNext = null;
+
+    function pageUrl(path, cursor) {
+      return cursor ? `${path}?cursor=${encodeURIComponent(cursor)}` : path;
+    }
+
     async function fetchAlerts() {
       try {
-        const res = await fetch('/alerts');
+        const res = await fetch(pageUrl('/alerts', alertPages[alertPages.length - 1]));
         const data = await res.json();
+        alertsNext = res.headers.get('X-Next-Cursor');
+        document.getElementById('alerts-older').disabled = !alertsNext;
+        document.getElementById('alerts-newer').disabled = alertPages.length === 1;
         const tbody = document.getElementById('alerts-body');
         tbody.innerHTML = '';
 
@@ -578,38 +687,46 @@ def ui():
         }
 
         for (const a of data) {
-          const tr = document.createElement('tr');
-
-          const severity = (a.severity || '').toLowerCase();
-          let sevClass = 'badge-low';
-          if (severity === 'critical') sevClass = 'badge-critical';
-          else if (severity === 'high') sevClass = 'badge-high';
-          else if (severity === 'medium') sevClass = 'badge-medium';
-
-          tr.innerHTML = `
-            <td><span class="timestamp">${a.time || ''}</span></td>
-            <td>${a.rule || ''}</td>
-            <td><span class="badge ${sevClass}">${a.severity || ''}</span></td>
-            <td><span class="ip">${a.ip || ''}</span></td>
-            <td>
-              <div class="host-user">
-                <span class="host">${a.host || ''}</span>
-                <span class="user">${a.user || ''}</span>
-              </div>
-            </td>
-            <td><div class="details" title="${a.details || ''}">${a.details || ''}</div></td>
-          `;
-          tbody.appendChild(tr);
+          tbody.appendChild(alertRow(a));
         }
       } catch (e) {
         console.error('Failed to fetch alerts', e);
       }
     }
 
+    function alertRow(a) {
+      const tr = document.createElement('tr');
+      tr.dataset.cursor = `${a.time}|${a.id}`;
+
+      const severity = (a.severity || '').toLowerCase();
+      let sevClass = 'badge-low';
+      if (severity === 'critical') sevClass = 'badge-critical';
+      else if (severity === 'high') sevClass = 'badge-high';
+      else if (severity === 'medium') sevClass = 'badge-medium';
+
+      tr.innerHTML = `
+        <td><span class="timestamp">${a.time || ''}</span></td>
+        <td>${a.rule || ''}</td>
+        <td><span class="badge ${sevClass}">${a.severity || ''}</span></td>
+        <td><span class="ip">${a.ip || ''}</span></td>
+        <td>
+          <div class="host-user">
+            <span class="host">${a.host || ''}</span>
+            <span class="user">${a.user || ''}</span>
+          </div>
+        </td>
+        <td><div class="details" title="${a.details || ''}">${a.details || ''}${a.count > 1 ? ` <span class="timestamp">(x${a.count}, last ${a.last_seen})</span>` : ''}</div></td>
+      `;
+      return tr;
+    }
+
     async function fetchTimeline() {
       try {
-        const res = await fetch('/timeline');
+        const res = await fetch(pageUrl('/timeline', timelinePages[timelinePages.length - 1]));
         const data = await res.json();
+        timelineNext = res.headers.get('X-Next-Cursor');
+        document.getElementById('timeline-older').disabled = !timelineNext;
+        document.getElementById('timeline-newer').disabled = timelinePages.length === 1;
         const tbody = document.getElementById('timeline-body');
         tbody.innerHTML = '';
 
@@ -619,56 +736,111 @@ def ui():
         }
 
         for (const ev of data) {
-          const tr = document.createElement('tr');
-
-          let statusClass = 'pill';
-          const statusVal = (ev.status || '').toLowerCase();
-          if (statusVal === 'success' || statusVal === 'ok') {
-            statusClass += ' pill-success';
-          } else if (statusVal === 'fail' || statusVal === 'error' || statusVal === 'blocked') {
-            statusClass += ' pill-fail';
-          }
-
-          // Website / URL cell content
-          const hasUrl = !!ev.url;
-          const urlTitle = ev.title || (hasUrl ? new URL(ev.url).hostname : '');
-          const urlText = ev.url || '';
-
-          const websiteCell = hasUrl
-            ? `
-              <div class="url-cell">
-                <div class="url-title" title="${urlTitle}">${urlTitle}</div>
-                <a class="url-link" href="${ev.url}" target="_blank" rel="noreferrer" title="${urlText}">
-                  ${urlText}
-                </a>
-              </div>
-            `
-            : `<span style="font-size:12px; color:#6b7280;">—</span>`;
-
-          tr.innerHTML = `
-            <td><span class="timestamp">${ev.time || ''}</span></td>
-            <td>
-              <div class="host-user">
-                <span class="host">${ev.host || ''}</span>
-                <span class="user">${ev.user || ''}</span>
-              </div>
-            </td>
-            <td>${ev.action || ''}</td>
-            <td><span class="${statusClass}">${ev.status || ''}</span></td>
-            <td><span class="ip">${ev.ip || ''}</span></td>
-            <td>${websiteCell}</td>
-          `;
-          tbody.appendChild(tr);
+          tbody.appendChild(eventRow(ev));
         }
       } catch (e) {
         console.error('Failed to fetch timeline', e);
       }
     }
 
+    function eventRow(ev) {
+      const tr = document.createElement('tr');
+      tr.dataset.cursor = `${ev.time}|${ev.id}`;
+
+      let statusClass = 'pill';
+      const statusVal = (ev.status || '').toLowerCase();
+      if (statusVal === 'success' || statusVal === 'ok') {
+        statusClass += ' pill-success';
+      } else if (statusVal === 'fail' || statusVal === 'error' || statusVal === 'blocked') {
+        statusClass += ' pill-fail';
+      }
+
+      // Website / URL cell content
+      const hasUrl = !!ev.url;
+      const urlTitle = ev.title || (hasUrl ? new URL(ev.url).hostname : '');
+      const urlText = ev.url || '';
+
+      const websiteCell = hasUrl
+        ? `
+          <div class="url-cell">
+            <div class="url-title" title="${urlTitle}">${urlTitle}</div>
+            <a class="url-link" href="${ev.url}" target="_blank" rel="noreferrer" title="${urlText}">
+              ${urlText}
+            </a>
+          </div>
+        `
+        : `<span style="font-size:12px; color:#6b7280;">—</span>`;
+
+      tr.innerHTML = `
+        <td><span class="timestamp">${ev.time || ''}</span></td>
+        <td>
+          <div class="host-user">
+            <span class="host">${ev.host || ''}</span>
+            <span class="user">${ev.user || ''}</span>
+          </div>
+        </td>
+        <td>${ev.action || ''}</td>
+        <td><span class="${statusClass}">${ev.status || ''}</span></td>
+        <td><span class="ip">${ev.ip || ''}</span></td>
+        <td>${websiteCell}</td>
+      `;
+      return tr;
+    }
+
+    function olderAlerts() {
+      if (alertsNext) { alertPages.push(alertsNext); fetchAlerts(); }
+    }
+    function newerAlerts() {
+      if (alertPages.length > 1) { alertPages.pop(); fetchAlerts(); }
+    }
+    function olderTimeline() {
+      if (timelineNext) { timelinePages.push(timelineNext); fetchTimeline(); }
+    }
+    function newerTimeline() {
+      if (timelinePages.length > 1) { timelinePages.pop(); fetchTimeline(); }
+    }
+
+    // Put pushed rows (newest first) on top of a newest page, keeping it at
+    // pageSize rows; returns the cursor of the new last row if any fell off.
+    function prependRows(tbodyId, rows, makeRow, pageSize) {
+      const tbody = document.getElementById(tbodyId);
+      if (tbody.querySelector('td[colspan]')) tbody.innerHTML = '';
+      for (const row of rows.slice().reverse()) {
+        tbody.insertBefore(makeRow(row), tbody.firstChild);
+      }
+      if (tbody.rows.length <= pageSize) return null;
+      while (tbody.rows.length > pageSize) tbody.deleteRow(-1);
+      return tbody.rows[tbody.rows.length - 1].dataset.cursor;
+    }
+
     fetchAlerts();
     fetchTimeline();
-    setInterval(fetchAlerts, 5000);
-    setInterval(fetchTimeline, 5000);
+
+    // one shared server-side poller feeds every open dashboard (see live_feed.py)
+    const live = new EventSource('/stream');
+    let liveConnected = false;
+    live.onopen = () => {
+      // after a reconnect, reload to pick up whatever was missed meanwhile
+      if (liveConnected) { fetchAlerts(); fetchTimeline(); }
+      liveConnected = true;
+    };
+    live.addEventListener('alerts', (e) => {
+      if (alertPages.length !== 1) return;
+      const cursor = prependRows('alerts-body', JSON.parse(e.data), alertRow, 50);
+      if (cursor) {
+        alertsNext = cursor;
+        document.getElementById('alerts-older').disabled = false;
+      }
+    });
+    live.addEventListener('events', (e) => {
+      if (timelinePages.length !== 1) return;
+      const cursor = prependRows('timeline-body', JSON.parse(e.data), eventRow, 100);
+      if (cursor) {
+        timelineNext = cursor;
+        document.getElementById('timeline-older').disabled = false;
+      }
+    });
+    live.addEventListener('resync', () => { fetchAlerts(); fetchTimeline(); });
   </script>
 </body>
 </html>
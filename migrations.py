@@ -0,0 +1,313 @@
+# migrations.py
+"""
+Versioned schema migrations for logs.db.
+
+The schema version lives in PRAGMA user_version. migrate() applies every
+migration newer than that, each in its own write transaction, and is safe
+to call from several processes at once: the version is re-checked after
+the write lock is taken. The ingester, rules engine and dashboard all
+call it on startup; `python migrations.py` (or init_db.py) runs it by hand.
+
+A migration step is either an SQL string or a function taking the
+connection (for data backfills, e.g. backfill_url_columns).
+
+`python migrations.py --check-plans` runs EXPLAIN QUERY PLAN over the
+rule and dashboard queries (QUERY_PLAN_CHECKS) and fails if any of them
+falls back to a full table scan or a temp-table sort.
+"""
+
+import argparse
+import json
+import sys
+
+from db import DB_PATH, connect, write_transaction
+from parsers import normalize_url
+
+BACKFILL_BATCH = 5000  # rows per read/update round in data backfills
+
+
+def _first(doc, *paths):
+    for path in paths:
+        value = doc
+        for key in path.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        if value:
+            return str(value)
+    return None
+
+
+def backfill_url_columns(conn):
+    """Copy url/title out of rawjson (with the dashboard's old fallback keys) into columns."""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, rawjson FROM logs WHERE id > ? AND rawjson IS NOT NULL ORDER BY id LIMIT ?",
+            (last_id, BACKFILL_BATCH),
+        ).fetchall()
+        if not rows:
+            return
+        updates = []
+        for id_, rawjson in rows:
+            try:
+                doc = json.loads(rawjson)
+            except ValueError:
+                continue
+            if not isinstance(doc, dict):
+                continue
+            url, domain = normalize_url(_first(doc, "url", "page_url", "request.url"))
+            title = _first(doc, "title", "page_title", "tab.title")
+            if url or title:
+                updates.append((url, domain, title, id_))
+        conn.executemany("UPDATE logs SET url=?, domain=?, title=? WHERE id=?", updates)
+        last_id = rows[-1][0]
+
+
+MIGRATIONS = [
+    (1, "create logs and alerts tables", [
+        """
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            host TEXT,
+            user TEXT,
+            action TEXT,
+            status TEXT,
+            ip TEXT,
+            rawjson TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            time TEXT,
+            rule TEXT,
+            severity TEXT,
+            ip TEXT,
+            user TEXT,
+            host TEXT,
+            details TEXT
+        )
+        """,
+    ]),
+    (2, "indexes for rule and dashboard queries", [
+        # /timeline: ORDER BY timestamp DESC, optionally WHERE host=?
+        "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_host_time ON logs (host, timestamp)",
+        # malicious_sites (action='browse' newest first), offhours_admin
+        "CREATE INDEX IF NOT EXISTS idx_logs_action_time ON logs (action, timestamp)",
+        # brute_force: failed logins in the window grouped by ip (covering)
+        "CREATE INDEX IF NOT EXISTS idx_logs_login ON logs (action, status, timestamp, ip)",
+        # brute_force: per-ip last fail / later success
+        "CREATE INDEX IF NOT EXISTS idx_logs_ip_login ON logs (ip, action, status, timestamp)",
+        # /alerts: ORDER BY time DESC
+        "CREATE INDEX IF NOT EXISTS idx_alerts_time ON alerts (time)",
+    ]),
+    (3, "per-rule high-water marks", [
+        """
+        CREATE TABLE IF NOT EXISTS rule_state (
+            rule TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # rules read "new rows of action X": action=? AND id > last_id
+        "CREATE INDEX IF NOT EXISTS idx_logs_action_id ON logs (action, id)",
+        # replaced by idx_logs_action_id / idx_logs_ip_login now that rules
+        # no longer rescan by time window
+        "DROP INDEX IF EXISTS idx_logs_action_time",
+        "DROP INDEX IF EXISTS idx_logs_login",
+    ]),
+    (4, "url/domain/title columns", [
+        "ALTER TABLE logs ADD COLUMN url TEXT",
+        "ALTER TABLE logs ADD COLUMN domain TEXT",
+        "ALTER TABLE logs ADD COLUMN title TEXT",
+        backfill_url_columns,
+        # /timeline?domain=, and "who visited X" lookups; most rows have no url
+        "CREATE INDEX IF NOT EXISTS idx_logs_domain_time ON logs (domain, timestamp) WHERE domain IS NOT NULL",
+    ]),
+    (5, "alert fingerprints for deduplication", [
+        "ALTER TABLE alerts ADD COLUMN fingerprint TEXT",
+        "ALTER TABLE alerts ADD COLUMN count INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE alerts ADD COLUMN last_seen TEXT",
+        "UPDATE alerts SET last_seen = time WHERE last_seen IS NULL",
+        # rows written before this migration have no fingerprint and are left as they are
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_fingerprint ON alerts (fingerprint) WHERE fingerprint IS NOT NULL",
+    ]),
+    (6, "per-rule run statistics", [
+        "ALTER TABLE rule_state ADD COLUMN runs INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE rule_state ADD COLUMN last_run TEXT",
+        "ALTER TABLE rule_state ADD COLUMN last_ms REAL",
+        "ALTER TABLE rule_state ADD COLUMN max_ms REAL",
+        "ALTER TABLE rule_state ADD COLUMN last_rows INTEGER",
+        "ALTER TABLE rule_state ADD COLUMN rows_scanned INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE rule_state ADD COLUMN alerts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE rule_state ADD COLUMN timeouts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE rule_state ADD COLUMN overruns INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE rule_state ADD COLUMN errors INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (7, "indexes for paged /timeline and /alerts filters", [
+        # pages are ORDER BY time DESC, id DESC with (time, id) < cursor; id is
+        # the rowid, which every index already ends with
+        "CREATE INDEX IF NOT EXISTS idx_logs_user_time ON logs (user, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_action_time ON logs (action, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_severity_time ON alerts (severity, time)",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_rule_time ON alerts (rule, time)",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_user_time ON alerts (user, time)",
+    ]),
+    (8, "alert change counter for response caching", [
+        # new alerts move MAX(id); these triggers catch the rest (dedup count
+        # bumps, deletes) so response_cache.py can tell when /alerts changed
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT OR IGNORE INTO table_versions (name) VALUES ('alerts')",
+        """
+        CREATE TRIGGER IF NOT EXISTS alerts_updated AFTER UPDATE ON alerts BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'alerts';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS alerts_deleted AFTER DELETE ON alerts BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'alerts';
+        END
+        """,
+    ]),
+]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn=None, verbose=True):
+    """Bring the schema up to the latest version; returns the resulting version."""
+    own = conn is None
+    if own:
+        conn = connect(DB_PATH)
+    try:
+        for version, description, steps in MIGRATIONS:
+            if version <= current_version(conn):
+                continue
+            with write_transaction(conn):
+                if version <= current_version(conn):
+                    continue  # another process applied it while we waited for the lock
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute(f"PRAGMA user_version={version}")
+            if verbose:
+                print(f"[DB] Applied migration {version}: {description}")
+        return current_version(conn)
+    finally:
+        if own:
+            conn.close()
+
+
+# (name, query, params) for every query shape the rules and dashboard run.
+# Each must be answered from an index: no plain "SCAN <table>" (a scan
+# "USING INDEX" walks rows in index order and stops at the LIMIT) and no
+# temp b-tree for ORDER BY. Grouping the rows of an indexed range in a
+# temp b-tree is fine.
+QUERY_PLAN_CHECKS = [
+    # the detection rules' own queries are added from rule_dsl (see rule_plan_checks)
+    ("rule cursor", "SELECT last_id FROM rule_state WHERE rule=?", ("brute_force",)),
+    ("timeline", """
+        SELECT id, timestamp, host, user, action, status, ip, url, domain, title FROM logs
+        ORDER BY timestamp DESC, id DESC LIMIT ?
+    """, (100,)),
+    ("timeline page", """
+        SELECT id, timestamp, host, user, action, status, ip, url, domain, title FROM logs
+        WHERE timestamp >= ? AND (timestamp, id) < (?, ?)
+        ORDER BY timestamp DESC, id DESC LIMIT ?
+    """, ("2026-01-01T00:00:00", "2026-01-15T00:00:00", 1000, 100)),
+    ("timeline by host", """
+        SELECT id, timestamp, host, user, action, status, ip, url, domain, title FROM logs
+        WHERE host = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?
+    """, ("LAPTOP", "2026-01-15T00:00:00", 1000, 100)),
+    ("timeline by domain", """
+        SELECT id, timestamp, host, user, action, status, ip, url, domain, title FROM logs
+        WHERE domain = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?
+    """, ("example.com", "2026-01-15T00:00:00", 1000, 100)),
+    ("timeline by user", """
+        SELECT id, timestamp, host, user, action, status, ip, url, domain, title FROM logs
+        WHERE user = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?
+    """, ("bob", "2026-01-15T00:00:00", 1000, 100)),
+    ("timeline by action", """
+        SELECT id, timestamp, host, user, action, status, ip, url, domain, title FROM logs
+        WHERE action = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?
+    """, ("login", "2026-01-15T00:00:00", 1000, 100)),
+    ("alerts", """
+        SELECT id, time, rule, severity, ip, user, host, details, count, last_seen FROM alerts
+        ORDER BY time DESC, id DESC LIMIT ?
+    """, (50,)),
+    ("alerts page", """
+        SELECT id, time, rule, severity, ip, user, host, details, count, last_seen FROM alerts
+        WHERE time >= ? AND (time, id) < (?, ?) ORDER BY time DESC, id DESC LIMIT ?
+    """, ("2026-01-01T00:00:00", "2026-01-15T00:00:00", 1000, 50)),
+    ("alerts by severity", """
+        SELECT id, time, rule, severity, ip, user, host, details, count, last_seen FROM alerts
+        WHERE severity = ? AND (time, id) < (?, ?) ORDER BY time DESC, id DESC LIMIT ?
+    """, ("high", "2026-01-15T00:00:00", 1000, 50)),
+    ("alerts by rule", """
+        SELECT id, time, rule, severity, ip, user, host, details, count, last_seen FROM alerts
+        WHERE rule = ? AND (time, id) < (?, ?) ORDER BY time DESC, id DESC LIMIT ?
+    """, ("Malicious website visited", "2026-01-15T00:00:00", 1000, 50)),
+    ("alerts by user", """
+        SELECT id, time, rule, severity, ip, user, host, details, count, last_seen FROM alerts
+        WHERE user = ? AND (time, id) < (?, ?) ORDER BY time DESC, id DESC LIMIT ?
+    """, ("bob", "2026-01-15T00:00:00", 1000, 50)),
+    ("alert fingerprint upsert", """
+        SELECT id FROM alerts WHERE fingerprint = ?
+    """, ("0" * 24,)),
+]
+
+
+def rule_plan_checks():
+    """(name, sql, params) for the queries of every rule in detections.json."""
+    from rule_dsl import default_rules  # rule_dsl -> threat_db; only needed for --check-plans
+    return [check for spec in default_rules() for check in spec.sql().plan_checks()]
+
+
+def query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def is_bad_step(step):
+    if step.startswith("SCAN ") and " USING " not in step:
+        return True
+    return step.startswith("USE TEMP B-TREE FOR ORDER BY")
+
+
+def check_query_plans(conn, checks=QUERY_PLAN_CHECKS):
+    """Return [(name, plan)] for every query whose plan regressed to a scan or sort."""
+    failures = []
+    for name, sql, params in checks:
+        plan = query_plan(conn, sql, params)
+        if any(is_bad_step(step) for step in plan):
+            failures.append((name, plan))
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--check-plans', action='store_true',
+                        help="EXPLAIN QUERY PLAN every rule/dashboard query and fail on full scans")
+    args = parser.parse_args()
+
+    conn = connect(DB_PATH)
+    version = migrate(conn)
+    print(f"[DB] Schema at version {version}")
+
+    if args.check_plans:
+        checks = QUERY_PLAN_CHECKS + rule_plan_checks()
+        failures = check_query_plans(conn, checks)
+        for name, plan in failures:
+            print(f"[DB] Query plan regression in '{name}': {' / '.join(plan)}")
+        if failures:
+            sys.exit(1)
+        print(f"[DB] All {len(checks)} queries use indexes")
+    conn.close()
@@ -0,0 +1,185 @@
+# multi_ingester.py
+"""
+Multi-process ingester: a supervisor starts N worker processes that each
+bind UDP 514 with SO_REUSEPORT, so the kernel spreads datagrams across
+them and parsing / json.dumps run on every core instead of behind one GIL.
+
+Workers turn events into log_row() tuples and hand them in small batches
+to a single writer process, which is the only one talking to SQLite.
+
+Shutdown (Ctrl-C or SIGTERM): workers stop receiving and send their last
+partial batch, then the writer drains the queue and flushes before exit.
+
+Run with:  python ingester.py --mode multiproc --workers 4
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import signal
+import socket
+import time
+
+from ingester import (
+    LISTEN_HOST,
+    LISTEN_PORT,
+    STATS_INTERVAL,
+    BATCH_MAX_DELAY,
+    BatchWriter,
+    log_row,
+    parse_log_line,
+)
+from stream_rules import StreamEngine
+
+DEFAULT_WORKERS = os.cpu_count() or 2
+WORKER_BATCH = 500  # rows per IPC message from worker to writer
+ROW_QUEUE_SIZE = 1000  # batches buffered between workers and the writer
+
+# per-worker counters in a shared array, WORKER_STATS slots per worker
+WORKER_STATS = ("received", "parsed", "failed", "batches")
+
+
+def bind_reuseport():
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("SO_REUSEPORT is not available on this platform; use --mode threaded")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((LISTEN_HOST, LISTEN_PORT))
+    return sock
+
+
+def ignore_shutdown_signals():
+    # Ctrl-C and systemd's SIGTERM reach the whole process group; the
+    # supervisor alone reacts, via stop (workers) and the None sentinel (writer)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def worker_main(index, rows_q, stop, stats):
+    ignore_shutdown_signals()
+    base = index * len(WORKER_STATS)
+    sock = bind_reuseport()
+    sock.settimeout(BATCH_MAX_DELAY)
+    rows = []
+    oldest = 0.0
+
+    while not stop.is_set():
+        try:
+            data, addr = sock.recvfrom(4096)
+        except socket.timeout:
+            data = None
+        except OSError as e:
+            print(f"[INGESTER] worker-{index} receive error: {e}")
+            data = None
+
+        if data is not None:
+            stats[base] += 1
+            line = data.decode('utf-8', errors='ignore').strip()
+            try:
+                parsed = parse_log_line(line, addr[0])
+            except Exception as e:
+                print(f"[INGESTER] worker-{index} parse error: {e}")
+                parsed = None
+            if parsed:
+                if not rows:
+                    oldest = time.monotonic()
+                rows.append(log_row(parsed))
+                stats[base + 1] += 1
+            else:
+                stats[base + 2] += 1
+
+        if rows and (len(rows) >= WORKER_BATCH or time.monotonic() - oldest >= BATCH_MAX_DELAY):
+            rows_q.put(rows)
+            stats[base + 3] += 1
+            rows = []
+
+    sock.close()
+    if rows:
+        rows_q.put(rows)
+        stats[base + 3] += 1
+
+
+def writer_main(rows_q, stream_rules=False):
+    ignore_shutdown_signals()
+    writer = BatchWriter(engine=StreamEngine() if stream_rules else None)
+    next_report = time.monotonic() + STATS_INTERVAL
+    while True:
+        try:
+            rows = rows_q.get(timeout=writer.max_delay)
+        except queue.Empty:
+            rows = []
+        if rows is None:  # supervisor's shutdown sentinel, sent after all workers exit
+            break
+        if rows:
+            writer.add_rows(rows)
+        writer.flush_if_due()
+        if time.monotonic() >= next_report:
+            writer.report()
+            next_report = time.monotonic() + STATS_INTERVAL
+    writer.close()
+    writer.report()
+
+
+def report_workers(stats, workers):
+    for i in range(workers):
+        base = i * len(WORKER_STATS)
+        values = " ".join(f"{name}={stats[base + j]}" for j, name in enumerate(WORKER_STATS))
+        print(f"[INGESTER] worker-{i}: {values}")
+
+
+def on_sigterm(signum, frame):
+    # take the Ctrl-C path; calling stop.set() here deadlocks if the signal
+    # lands while this thread holds the lock inside an Event method
+    raise KeyboardInterrupt
+
+
+def run_multiproc(workers=DEFAULT_WORKERS, stream_rules=False):
+    # fail in the supervisor rather than in every worker
+    bind_reuseport().close()
+
+    stop = mp.Event()
+    rows_q = mp.Queue(ROW_QUEUE_SIZE)
+    # lock=False: each slot has a single writer (its worker)
+    stats = mp.Array("q", workers * len(WORKER_STATS), lock=False)
+
+    writer = mp.Process(target=writer_main, args=(rows_q, stream_rules), name="writer")
+    procs = [
+        mp.Process(target=worker_main, args=(i, rows_q, stop, stats), name=f"worker-{i}")
+        for i in range(workers)
+    ]
+    # Children inherit these signals blocked and ignore them before anything
+    # else. The supervisor's SIGTERM handler goes in only once they are all
+    # running; a signal that arrived meanwhile is delivered to it on unblock.
+    shutdown = {signal.SIGINT, signal.SIGTERM}
+    try:
+        signal.pthread_sigmask(signal.SIG_BLOCK, shutdown)
+        try:
+            writer.start()
+            for p in procs:
+                p.start()
+        finally:
+            signal.signal(signal.SIGTERM, on_sigterm)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, shutdown)
+        print(f"[INGESTER] Listening on {LISTEN_HOST}:{LISTEN_PORT} with {workers} SO_REUSEPORT workers")
+        while True:
+            time.sleep(STATS_INTERVAL)
+            report_workers(stats, workers)
+    except KeyboardInterrupt:
+        pass
+    # the children ignore signals, so an interrupted drain would orphan them;
+    # further Ctrl-C / SIGTERM (e.g. timeout(1) also signals the group) wait
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    print("\n[INGESTER] Stopping, flushing in-flight batches...")
+    stop.set()
+    for p in procs:
+        if p.pid is not None:  # started
+            p.join()
+    if writer.pid is not None:
+        rows_q.put(None)
+        writer.join()
+    report_workers(stats, workers)
+
+
+if __name__ == "__main__":
+    run_multiproc()
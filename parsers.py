@@ -0,0 +1,261 @@
+# parsers.py
+"""
+Log format registry with per-source auto-detection.
+
+Registered formats (tried in this order when detecting):
+  json     - one JSON object per line, optionally behind a <PRI> header
+  rfc5424  - <PRI>1 TIMESTAMP HOST APP PROCID MSGID [SD] MSG
+  rfc3164  - <PRI>Mmm dd hh:mm:ss HOST TAG: MSG
+  kv       - the agents' own "<13>ISO-TIME localhost chrome user=... action=..." lines
+
+Every parser returns the same event dict the ingester stores, or None if
+the line isn't in its format. FormatDetector remembers which parser worked
+for each source address, so normally only one parser runs per line. After
+REDETECT_AFTER consecutive failures from a source it forgets the choice and
+detects again.
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from tokenizer import parse_fields, parse_header
+
+REDETECT_AFTER = 5  # consecutive failures before a source's format is re-detected
+MAX_SOURCES = 10000  # cached source -> parser entries (oldest evicted first)
+KEEP_UNPARSED = True  # store lines no parser understands as raw "unknown" events
+
+PARSERS = OrderedDict()
+
+
+def register(name):
+    """Decorator: add a parse(line) -> dict | None function to the registry."""
+    def wrap(fn):
+        PARSERS[name] = fn
+        return fn
+    return wrap
+
+
+def normalize_url(url):
+    """Return (url, domain): the stripped URL and its lower-case host, or Nones."""
+    if not url:
+        return None, None
+    url = url.strip()
+    if not url:
+        return None, None
+    target = url
+    if "//" not in url:
+        scheme, sep, rest = url.split("/", 1)[0].partition(":")
+        if sep and not rest.isdigit():
+            return url, None  # about:blank, mailto:, javascript: ...
+        target = "//" + url  # bare "example.com/path"
+    try:
+        host = urlsplit(target).hostname
+    except ValueError:
+        host = None
+    return url, (host.rstrip(".") or None) if host else None
+
+
+def make_event(raw, timestamp=None, fields=None, host=None):
+    fields = fields or {}
+    url, domain = normalize_url(fields.get("url"))
+    return {
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "host": fields.get("host") or host or "unknown",
+        "user": fields.get("user", "unknown"),
+        "action": fields.get("action", "unknown"),
+        "status": fields.get("status", "unknown"),
+        "ip": fields.get("ip", "-"),
+        "url": url,
+        "domain": domain,
+        "title": fields.get("title"),
+        "raw": raw,
+    }
+
+
+# -- json ------------------------------------------------------------------
+
+JSON_ALIASES = {
+    "timestamp": ("timestamp", "@timestamp", "time", "ts"),
+    "host": ("host", "hostname", "device"),
+    "user": ("user", "username", "user_name"),
+    "action": ("action", "event", "event_type"),
+    "status": ("status", "outcome", "result"),
+    "ip": ("ip", "src_ip", "source_ip", "client_ip"),
+    "url": ("url", "page_url"),
+    "title": ("title", "page_title"),
+}
+
+
+@register("json")
+def parse_json(line):
+    body = line
+    if line.startswith("<"):
+        gt = line.find(">", 1, 6)
+        if gt != -1:
+            body = line[gt + 1:].lstrip()
+    if not body.startswith("{"):
+        return None
+    try:
+        doc = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(doc, dict):
+        return None
+
+    fields = {}
+    for field, keys in JSON_ALIASES.items():
+        for key in keys:
+            value = doc.get(key)
+            if value is not None and not isinstance(value, (dict, list)):
+                fields[field] = str(value)
+                break
+    return make_event(line, fields.pop("timestamp", None), fields)
+
+
+# -- RFC 5424 --------------------------------------------------------------
+
+RFC5424_RE = re.compile(
+    r'<(\d{1,3})>1 (\S+) (\S+) (\S+) (\S+) (\S+) '
+    r'(-|(?:\[(?:[^\]\\"]|\\.|"(?:[^"\\]|\\.)*")*\])+)'
+    r'(?: (.*))?$',
+    re.S,
+)
+SD_PARAM_RE = re.compile(r'([^\s=\]"]+)="((?:[^"\\]|\\.)*)"')
+
+
+@register("rfc5424")
+def parse_rfc5424(line):
+    m = RFC5424_RE.match(line)
+    if not m:
+        return None
+    pri, timestamp, hostname, app, procid, msgid, sd, msg = m.groups()
+
+    fields = {}
+    if sd != "-":
+        for key, value in SD_PARAM_RE.findall(sd):
+            fields[key] = re.sub(r'\\(["\\\]])', r'\1', value)
+    if msg:
+        fields.update(parse_fields(msg.lstrip("\ufeff")))
+    return make_event(
+        line,
+        None if timestamp == "-" else timestamp,
+        fields,
+        None if hostname == "-" else hostname,
+    )
+
+
+# -- RFC 3164 --------------------------------------------------------------
+
+RFC3164_RE = re.compile(
+    r'<(\d{1,3})>([A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d) (\S+) '
+    r'(?:[\w./-]+(?:\[\d+\])?: ?)?(.*)$',
+    re.S,
+)
+
+
+@register("rfc3164")
+def parse_rfc3164(line):
+    m = RFC3164_RE.match(line)
+    if not m:
+        return None
+    pri, stamp, hostname, msg = m.groups()
+    now = datetime.now()
+    try:
+        # RFC 3164 timestamps carry no year
+        ts = datetime.strptime(f"{now.year} {stamp}", "%Y %b %d %H:%M:%S")
+    except ValueError:
+        return None
+    if ts > now.replace(microsecond=0) and ts.month > now.month:
+        ts = ts.replace(year=now.year - 1)  # December lines read in January
+    return make_event(line, ts.isoformat(), parse_fields(msg), hostname)
+
+
+# -- agent key=value -------------------------------------------------------
+
+MONTHS = frozenset(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"))
+
+
+@register("kv")
+def parse_kv(line):
+    pri, timestamp, hostname, body = parse_header(line)
+    # key=value is the most permissive format; turn away lines that belong to
+    # the others so a cached kv source still notices when its format changes
+    if timestamp == "1" or line[body:body + 1] == "{":
+        return None
+    if pri is not None and timestamp is None and line[body:body + 3] in MONTHS:
+        return None
+    fields = parse_fields(line[body:] if body else line)
+    if not fields:
+        return None
+    return make_event(line, timestamp, fields)
+
+
+class FormatDetector:
+    """Caches the winning parser per source and re-detects after repeated failures."""
+
+    def __init__(self, parsers=PARSERS, redetect_after=REDETECT_AFTER, max_sources=MAX_SOURCES):
+        self.parsers = parsers
+        self.redetect_after = redetect_after
+        self.max_sources = max_sources
+        self.sources = OrderedDict()  # source -> [format name, consecutive failures]
+        self.lock = threading.Lock()
+        self.stats = {"detections": 0, "redetections": 0, "unparsed": 0}
+        self.by_format = {name: 0 for name in parsers}
+
+    def parse(self, line, source=None):
+        entry = self.sources.get(source)
+        if entry is not None:
+            event = self.parsers[entry[0]](line)
+            if event is not None:
+                entry[1] = 0
+                with self.lock:  # += is not atomic across --parsers threads
+                    self.by_format[entry[0]] += 1
+                return event
+            with self.lock:
+                entry[1] += 1
+                if entry[1] >= self.redetect_after:
+                    self.sources.pop(source, None)
+                    self.stats["redetections"] += 1
+            skip = entry[0]
+        else:
+            skip = None
+
+        for name, parser in self.parsers.items():
+            if name == skip:
+                continue
+            event = parser(line)
+            if event is not None:
+                with self.lock:
+                    self.by_format[name] += 1
+                if source not in self.sources:
+                    self._remember(source, name)
+                return event
+
+        with self.lock:
+            self.stats["unparsed"] += 1
+        return make_event(line) if KEEP_UNPARSED else None
+
+    def _remember(self, source, name):
+        with self.lock:
+            self.stats["detections"] += 1
+            self.sources[source] = [name, 0]
+            while len(self.sources) > self.max_sources:
+                self.sources.popitem(last=False)
+
+    def format_of(self, source):
+        entry = self.sources.get(source)
+        return entry[0] if entry else None
+
+    def report(self):
+        with self.lock:
+            counts = " ".join(f"{name}={n}" for name, n in self.by_format.items())
+            s = dict(self.stats)
+        print(
+            f"[INGESTER] formats: {counts} unparsed={s['unparsed']} "
+            f"sources={len(self.sources)} detections={s['detections']} "
+            f"redetections={s['redetections']}"
+        )
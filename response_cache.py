@@ -0,0 +1,113 @@
+# response_cache.py
+"""
+Cache for the dashboard's read endpoints (main.py), with ETags.
+
+Every response is keyed by path + query string and tagged with the
+version of the table it was read from:
+
+  logs    MAX(id) (logs rows are only ever appended)
+  alerts  MAX(id) plus table_versions.alerts, which triggers bump on every
+          UPDATE / DELETE (dedup count bumps, see migrations.py)
+
+Those two lookups only run when PRAGMA data_version says another
+connection has committed since the last check, so an idle database costs
+one pragma per request. A request whose If-None-Match matches the current
+ETag gets 304 without touching the cache entry or the query; otherwise a
+cached body for the current version is sent as is. Entries for old
+versions are simply never matched again and age out of the LRU.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from db import DB_PATH, connect_readonly
+
+CACHE_SIZE = 256  # cached responses (least recently used evicted)
+
+VERSION_SQL = {
+    "logs": "SELECT COALESCE(MAX(id), 0) FROM logs",
+    "alerts": """
+        SELECT COALESCE((SELECT MAX(id) FROM alerts), 0) || '.' ||
+               COALESCE((SELECT version FROM table_versions WHERE name = 'alerts'), 0)
+    """,
+}
+
+
+class CachedResponse:
+    __slots__ = ("etag", "body", "headers")
+
+    def __init__(self, etag, body, headers):
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+
+
+class ResponseCache:
+    def __init__(self, db_path=DB_PATH, max_entries=CACHE_SIZE):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (key, version) -> CachedResponse
+        self.lock = threading.Lock()
+        self.conn = None
+        self.data_version = None
+        self.versions = {}
+        self.counts = {"hits": 0, "misses": 0, "not_modified": 0, "evicted": 0, "version_queries": 0}
+
+    def version(self, table):
+        """Current version string of table; cheap when nothing was committed."""
+        with self.lock:
+            if self.conn is None:
+                self.conn = connect_readonly(self.db_path, check_same_thread=False)
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self.data_version:
+                self.versions = {}
+                self.data_version = data_version
+            if table not in self.versions:
+                self.counts["version_queries"] += 1
+                self.versions[table] = str(self.conn.execute(VERSION_SQL[table]).fetchone()[0])
+            return self.versions[table]
+
+    @staticmethod
+    def etag(key, version):
+        digest = hashlib.blake2b(f"{key}\x1f{version}".encode(), digest_size=12).hexdigest()
+        return f'"{digest}"'
+
+    def not_modified(self, if_none_match, etag):
+        """True (and counted) when the client already has this etag."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() != "*" and etag not in (t.strip() for t in if_none_match.split(",")):
+            return False
+        with self.lock:
+            self.counts["not_modified"] += 1
+        return True
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get((key, version))
+            if entry is None:
+                self.counts["misses"] += 1
+                return None
+            self.entries.move_to_end((key, version))
+            self.counts["hits"] += 1
+            return entry
+
+    def put(self, key, version, body, headers=None):
+        entry = CachedResponse(self.etag(key, version), body, headers or {})
+        with self.lock:
+            self.entries[(key, version)] = entry
+            self.entries.move_to_end((key, version))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counts["evicted"] += 1
+        return entry
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            hit_rate = self.counts["hits"] / lookups if lookups else 0.0
+            return dict(self.counts, entries=len(self.entries), hit_rate=round(hit_rate, 3))
+
+
+CACHE = ResponseCache()
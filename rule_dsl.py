@@ -0,0 +1,372 @@
+# rule_dsl.py
+"""
+Declarative detection rules.
+
+Rules live in detections.json (or a .yaml file if PyYAML is installed),
+one object per rule:
+
+  name          rule_state / cursor name
+  title         alert rule text
+  severity      alert severity
+  match         field filters the triggering event must pass
+  preceded_by   sequence: {match, count, window, group_by} -- fire when at
+                least `count` events passing `match` share the trigger's
+                group_by fields within `window` before it ("fail x5 then
+                success")
+  threshold     {count, window, group_by} -- fire when the trigger is the
+                count-th (or later) matching event of its group in window
+  lookup        "threat_db": also require a threat-intel hit on the
+                event's domain/url; one alert per hit
+  alert_fields  event fields copied to the alert (ip/user/host)
+  details       str.format template over the event fields, plus count
+                (sequence/threshold) or indicator/reason (lookup)
+  key           template for the dedup key (see alert_dedup.py)
+  interval, timeout   scheduler settings (rules.py), in seconds
+
+Filters map a field to a value (equality) or to {op: value} with op one
+of eq ne lt lte gt gte in not_in between not_between exists. Fields are
+the logs columns plus "hour" (from the timestamp). Windows are seconds or
+"30s" / "5m" / "1h".
+
+Each rule compiles two ways:
+  - SqlRule: one indexed query for new rows past the rule's cursor (action
+    filters use idx_logs_action_id), plus an indexed COUNT per trigger row
+    for sequences/thresholds. rules.py runs these on its schedule.
+  - StreamRule: a Python predicate and a SlidingWindowCounter per rule,
+    for stream_rules.StreamEngine inside the ingester.
+"""
+
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from sliding_window import SlidingWindowCounter
+from threat_db import match_domain
+
+DETECTIONS_PATH = "detections.json"
+DEFAULT_INTERVAL = 30  # seconds
+DEFAULT_TIMEOUT = 20  # seconds
+MAX_TRACKED_KEYS = 100000  # per streaming rule, before the least recently used group is evicted
+
+COLUMNS = ("timestamp", "host", "user", "action", "status", "ip", "url", "domain", "title")
+DERIVED_SQL = {
+    "hour": "(CASE WHEN substr(timestamp, 12, 2) GLOB '[0-9][0-9]' "
+            "THEN CAST(substr(timestamp, 12, 2) AS INTEGER) END)",
+}
+COMPARE_OPS = {"eq": "=", "ne": "!=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+MISSING = (None, "", "-", "unknown")  # group_by values that never form a group
+WINDOW_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhd]?)$")
+WINDOW_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class RuleError(ValueError):
+    pass
+
+
+def parse_window(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = WINDOW_RE.match(str(value).strip().lower())
+    if not m:
+        raise RuleError(f"bad window {value!r}")
+    return float(m.group(1)) * WINDOW_UNITS[m.group(2)]
+
+
+def load_rules(path=DETECTIONS_PATH):
+    """Read and validate rule specs from a JSON (or YAML) file."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuleError(f"{path}: YAML rules need PyYAML (pip install pyyaml)")
+            specs = yaml.safe_load(f)
+        else:
+            specs = json.load(f)
+    rules = [RuleSpec(spec) for spec in specs]
+    names = [r.name for r in rules]
+    if len(set(names)) != len(names):
+        raise RuleError(f"{path}: duplicate rule names")
+    return rules
+
+
+# ---------------- Field filters ----------------
+
+def _hour(event):
+    ts = event.get("timestamp")
+    try:
+        return int(ts[11:13])
+    except (TypeError, ValueError):
+        return None
+
+
+def _getter(field):
+    if field == "hour":
+        return _hour
+    if field not in COLUMNS:
+        raise RuleError(f"unknown field {field!r}")
+    return lambda event: event.get(field)
+
+
+def _normalize(filters):
+    """[(field, op, value)] from a match dict."""
+    out = []
+    for field, cond in (filters or {}).items():
+        if field not in COLUMNS and field not in DERIVED_SQL:
+            raise RuleError(f"unknown field {field!r}")
+        if not isinstance(cond, dict):
+            cond = {"eq": cond}
+        for op, value in cond.items():
+            if op not in COMPARE_OPS and op not in ("in", "not_in", "between", "not_between", "exists"):
+                raise RuleError(f"unknown operator {op!r} on {field!r}")
+            if op in ("between", "not_between") and len(value) != 2:
+                raise RuleError(f"{op} on {field!r} needs [low, high]")
+            out.append((field, op, value))
+    return out
+
+
+def filters_sql(filters):
+    """(where-clause fragments, params) for normalized filters."""
+    clauses, params = [], []
+    for field, op, value in filters:
+        expr = DERIVED_SQL.get(field, field)
+        if op in COMPARE_OPS:
+            clauses.append(f"{expr} {COMPARE_OPS[op]} ?")
+            params.append(value)
+        elif op in ("in", "not_in"):
+            marks = ", ".join("?" * len(value))
+            clauses.append(f"{expr} {'NOT IN' if op == 'not_in' else 'IN'} ({marks})")
+            params.extend(value)
+        elif op in ("between", "not_between"):
+            clauses.append(f"{expr} {'NOT BETWEEN' if op == 'not_between' else 'BETWEEN'} ? AND ?")
+            params.extend(value)
+        else:  # exists
+            clauses.append(f"{expr} IS {'NOT ' if value else ''}NULL")
+    return clauses, params
+
+
+def _test(op, value):
+    # mirrors SQL: a missing field fails every comparison
+    if op == "exists":
+        return (lambda v: v is not None) if value else (lambda v: v is None)
+    if op == "eq":
+        return lambda v: v is not None and v == value
+    if op == "ne":
+        return lambda v: v is not None and v != value
+    if op == "lt":
+        return lambda v: v is not None and v < value
+    if op == "lte":
+        return lambda v: v is not None and v <= value
+    if op == "gt":
+        return lambda v: v is not None and v > value
+    if op == "gte":
+        return lambda v: v is not None and v >= value
+    if op in ("in", "not_in"):
+        values = frozenset(value)
+        if op == "in":
+            return lambda v: v is not None and v in values
+        return lambda v: v is not None and v not in values
+    low, high = value
+    if op == "between":
+        return lambda v: v is not None and low <= v <= high
+    return lambda v: v is not None and not low <= v <= high
+
+
+def filters_predicate(filters):
+    """event -> bool for normalized filters."""
+    checks = [(_getter(field), _test(op, value)) for field, op, value in filters]
+
+    def predicate(event):
+        for get, test in checks:
+            if not test(get(event)):
+                return False
+        return True
+    return predicate
+
+
+# ---------------- Rule spec ----------------
+
+class RuleSpec:
+    def __init__(self, spec):
+        try:
+            self.name = spec["name"]
+            self.title = spec.get("title", self.name)
+            self.severity = spec.get("severity", "medium")
+            self.match = _normalize(spec.get("match"))
+            self.lookup = spec.get("lookup")
+            self.alert_fields = tuple(spec.get("alert_fields", ("ip", "user", "host")))
+            self.details = spec.get("details", self.title)
+            self.key = spec.get("key")
+            self.interval = float(spec.get("interval", DEFAULT_INTERVAL))
+            self.timeout = float(spec.get("timeout", DEFAULT_TIMEOUT))
+            # counted: the preceded_by / threshold clause, if any
+            self.counted = None
+            self.is_sequence = "preceded_by" in spec
+            if self.is_sequence and "threshold" in spec:
+                raise RuleError("use either preceded_by or threshold")
+            if self.is_sequence:
+                seq = spec["preceded_by"]
+                self.counted = _Counted(seq, _normalize(seq.get("match")))
+            elif "threshold" in spec:
+                self.counted = _Counted(spec["threshold"], self.match)
+        except (KeyError, TypeError) as e:
+            raise RuleError(f"rule {spec.get('name', '?')}: missing or bad {e}")
+        if self.lookup not in (None, "threat_db"):
+            raise RuleError(f"rule {self.name}: unknown lookup {self.lookup!r}")
+        for field in self.alert_fields:
+            if field not in ("ip", "user", "host"):
+                raise RuleError(f"rule {self.name}: alerts carry ip/user/host, not {field!r}")
+
+    def alerts_for(self, event, count=None):
+        """Alert kwargs (for rules.alert_row) raised by an event that passed every check."""
+        base = {f: event.get(f) for f in self.alert_fields}
+        fmt = dict(event, count=count)
+        if self.lookup == "threat_db":
+            hits = match_domain(event.get("domain"), event.get("url"))
+        else:
+            hits = [(None, None)]
+        out = []
+        for indicator, reason in hits:
+            fmt["indicator"], fmt["reason"] = indicator, reason
+            out.append(dict(
+                base,
+                rule=self.title,
+                severity=self.severity,
+                details=self.details.format(**fmt),
+                key=self.key.format(**fmt) if self.key else None,
+            ))
+        return out
+
+    def sql(self):
+        return SqlRule(self)
+
+    def stream(self):
+        return StreamRule(self)
+
+
+class _Counted:
+    """count / window / group_by of a sequence or threshold clause."""
+
+    def __init__(self, spec, filters):
+        self.count = int(spec["count"])
+        self.window = parse_window(spec["window"])
+        self.group_by = tuple(spec.get("group_by", ()))
+        for field in self.group_by:
+            if field not in COLUMNS:
+                raise RuleError(f"cannot group by {field!r}")
+        self.filters = filters
+
+    def group(self, event):
+        values = tuple(event.get(f) for f in self.group_by)
+        return None if any(v in MISSING for v in values) else values
+
+
+# ---------------- SQL (scheduled) ----------------
+
+class SqlRule:
+    """New rows past the cursor via one indexed query; counts via indexed COUNT(*)."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.name
+        clauses, params = filters_sql(spec.match)
+        where = " AND ".join(clauses + ["id > ?"])
+        self.trigger_sql = (
+            f"SELECT id, {', '.join(COLUMNS)} FROM logs WHERE {where} ORDER BY id LIMIT ?"
+        )
+        self.trigger_params = tuple(params)
+        self.count_sql = None
+        counted = spec.counted
+        if counted:
+            clauses, params = filters_sql(counted.filters)
+            clauses += [f"{f} = ?" for f in counted.group_by]
+            clauses += ["timestamp >= ?", "timestamp <= ?"]
+            self.count_sql = f"SELECT COUNT(*) FROM logs WHERE {' AND '.join(clauses)}"
+            self.count_params = tuple(params)
+
+    def evaluate(self, conn, row):
+        """Alerts for one trigger row (id, *COLUMNS)."""
+        event = dict(zip(COLUMNS, row[1:]))
+        spec = self.spec
+        count = None
+        counted = spec.counted
+        if counted:
+            group = counted.group(event)
+            if group is None:
+                return []
+            try:
+                ts = datetime.fromisoformat(event["timestamp"])
+            except (TypeError, ValueError):
+                return []
+            start = (ts - timedelta(seconds=counted.window)).isoformat()
+            count = conn.execute(
+                self.count_sql, (*self.count_params, *group, start, event["timestamp"])
+            ).fetchone()[0]
+            if count < counted.count:
+                return []
+        return spec.alerts_for(event, count)
+
+    def plan_checks(self):
+        """(name, sql, params) for migrations.py --check-plans."""
+        checks = [(f"{self.name} new rows", self.trigger_sql, (*self.trigger_params, 0, 5000))]
+        if self.count_sql:
+            counted = self.spec.counted
+            checks.append((
+                f"{self.name} window count", self.count_sql,
+                (*self.count_params, *("x" for _ in counted.group_by),
+                 "2026-01-01T00:00:00", "2026-01-01T00:05:00"),
+            ))
+        return checks
+
+
+# ---------------- Streaming ----------------
+
+class StreamRule:
+    """Same rule as a per-event predicate with in-memory window counts."""
+
+    def __init__(self, spec, max_keys=MAX_TRACKED_KEYS):
+        self.spec = spec
+        self.name = spec.name
+        self.matches = filters_predicate(spec.match)
+        counted = spec.counted
+        self.counts = SlidingWindowCounter(counted.window, max_keys=max_keys) if counted else None
+        self.counted_matches = filters_predicate(counted.filters) if spec.is_sequence else None
+
+    def process(self, event):
+        spec = self.spec
+        counted = spec.counted
+        if spec.is_sequence and self.counted_matches(event):
+            group = counted.group(event)
+            ts = _event_ts(event)
+            if group is not None and ts is not None:
+                self.counts.add(group, ts)
+        if not self.matches(event):
+            return []
+        count = None
+        if counted:
+            group = counted.group(event)
+            ts = _event_ts(event)
+            if group is None or ts is None:
+                return []
+            if spec.is_sequence:
+                count = self.counts.count(group, ts)
+            else:
+                count = self.counts.add(group, ts)
+            if count < counted.count:
+                return []
+        return spec.alerts_for(event, count)
+
+
+def _event_ts(event):
+    try:
+        return datetime.fromisoformat(event["timestamp"])
+    except (TypeError, ValueError):
+        return None
+
+
+def default_rules(path=DETECTIONS_PATH):
+    """Rules from detections.json next to this module unless path exists relative to cwd."""
+    if not os.path.exists(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.basename(path))
+    return load_rules(path)
@@ -1,146 +1,373 @@
+from datetime import datetime
 import sqlite3
-from datetime import datetime, timedelta
+import threading
 import time
-import json
-from threat_db import SUSPICIOUS_DOMAINS
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from alert_dedup import SUPPRESSOR, collapse, fingerprint
+from threat_db import prefilter_report, start_feed_watcher
+from rule_dsl import DETECTIONS_PATH, default_rules
+from db import DB_PATH, connect, connect_readonly, lock_report, write_transaction
+from migrations import migrate
 
 
-DB_PATH = "logs.db"
+# repeats of an alert within its dedup window (see alert_dedup.py) bump
+# count/last_seen on the existing row instead of inserting a new one
+INSERT_ALERT_SQL = """
+    INSERT INTO alerts (time, rule, severity, ip, user, host, details, fingerprint, count, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(fingerprint) WHERE fingerprint IS NOT NULL DO UPDATE SET
+        count = count + excluded.count,
+        last_seen = excluded.last_seen,
+        details = excluded.details
+"""
 
-def insert_alert(conn, rule, severity, ip=None, user=None, host=None, details=None):
+
+def alert_row(rule, severity, ip=None, user=None, host=None, details=None, key=None):
+    """key: the detail that tells two alerts of this rule apart (e.g. the flagged domain)."""
+    # one epoch reading for both; datetime.utcnow().timestamp() would read
+    # the naive UTC time as local time and shift the dedup bucket
+    now = time.time()
+    ts = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now))
+    return (
+        ts,
+        rule,
+        severity,
+        ip,
+        user,
+        host,
+        details,
+        fingerprint(rule, ip, user, host, key, now),
+        1,
+        ts,
+    )
+
+
+def announce(row):
+    """Print an alert the first time its fingerprint is seen; repeats are only counted."""
+    if SUPPRESSOR.observe(row[7]):
+        print(f"[ALERT] {row[1]}: {row[6]}")
+
+
+def write_alerts(conn, rows):
+    """Upsert alert_row() tuples inside the caller's transaction; returns their alert ids.
+
+    Repeats of one fingerprint are merged first, so ids can be shorter than rows.
+    """
+    sql = INSERT_ALERT_SQL + " RETURNING id"
+    return [conn.execute(sql, row).fetchone()[0] for row in collapse(rows)]
+
+
+def insert_alert(conn, rule, severity, ip=None, user=None, host=None, details=None, key=None):
+    """Write a single alert in its own transaction; returns its id."""
+    row = alert_row(rule, severity, ip, user, host, details, key)
+    announce(row)
+    with write_transaction(conn):
+        return write_alerts(conn, [row])[0]
+
+
+# Alerts found during a rule pass are buffered and written in one
+# transaction with the rule cursors they belong to, instead of one commit
+# per alert. A pass that finds more than ALERT_FLUSH_ROWS alerts writes
+# them in several transactions.
+ALERT_FLUSH_ROWS = 1000
+
+
+class RuleTimeout(Exception):
+    pass
+
+
+class AlertBuffer:
+    """Alerts and cursor moves of a rule pass, written together.
+
+    lock: serializes flushes when several rule threads share one writer conn.
+    deadline: time.monotonic() after which advance() raises RuleTimeout.
+    """
+
+    def __init__(self, conn, max_rows=ALERT_FLUSH_ROWS, lock=None, deadline=None):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.lock = lock or threading.Lock()
+        self.deadline = deadline
+        self.rows = []
+        self.cursors = {}
+        self.ids = []  # ids of every alert written through this buffer
+        self.scanned = 0  # rows handed to advance()
+        self.mark = 0  # rows before this index belong to chunks already advanced over
+
+    def add(self, rule, severity, ip=None, user=None, host=None, details=None, key=None):
+        row = alert_row(rule, severity, ip, user, host, details, key)
+        announce(row)
+        self.rows.append(row)
+
+    def advance(self, rule, last_id, scanned=0):
+        """Move rule's cursor to last_id once the alerts queued so far are written."""
+        self.cursors[rule] = last_id
+        self.scanned += scanned
+        self.mark = len(self.rows)
+        if len(self.rows) >= self.max_rows:
+            self.flush()
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise RuleTimeout(rule)
+
+    def discard_partial(self):
+        """Drop alerts from a chunk the rule never finished (it is redone next pass)."""
+        del self.rows[self.mark:]
+
+    def flush(self):
+        """Write pending alerts and cursors in one transaction; returns the new alert ids."""
+        if not self.rows and not self.cursors:
+            return []
+        with self.lock:
+            with write_transaction(self.conn):
+                ids = write_alerts(self.conn, self.rows)
+                for rule, last_id in self.cursors.items():
+                    set_cursor(self.conn, rule, last_id)
+        self.rows = []
+        self.cursors = {}
+        self.mark = 0
+        self.ids.extend(ids)
+        return ids
+
+
+# Each rule remembers the highest logs.id it has evaluated (rule_state) and
+# only looks at rows above it, so a pass costs O(new events) and an event
+# raises its alert once. Rows are read in chunks of RULE_BATCH.
+RULE_BATCH = 5000
+
+
+def get_cursor(conn, rule):
+    row = conn.execute("SELECT last_id FROM rule_state WHERE rule=?", (rule,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_cursor(conn, rule, last_id):
+    """Move rule's cursor forward to last_id; never back.
+
+    The ingester's advance_cursors() may have moved it past last_id while
+    this pass was running, and those rows were already evaluated.
+    """
     conn.execute(
         """
-        INSERT INTO alerts (time, rule, severity, ip, user, host, details)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO rule_state (rule, last_id) VALUES (?, ?)
+        ON CONFLICT(rule) DO UPDATE SET last_id=MAX(last_id, excluded.last_id)
         """,
-        (
-            datetime.utcnow().isoformat(timespec="seconds"),
-            rule,
-            severity,
-            ip,
-            user,
-            host,
-            details,
-        ),
+        (rule, last_id),
     )
-    conn.commit()
-
-def check_malicious_sites(conn):
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT timestamp, host, user, rawjson
-        FROM logs
-        WHERE action='browse'
-        ORDER BY timestamp DESC
-        LIMIT 20
-    """)
-    rows = cur.fetchall()
-
-    for ts, host, user, rawjson in rows:
-        if not rawjson:
-            continue
 
-        try:
-            data = json.loads(rawjson)
-            url = data.get("url")
-            if not url:
-                continue
 
-            domain = urlparse(url).netloc.lower()
-            print("[DEBUG] Checking domain:", domain)
-
-            for bad, reason in SUSPICIOUS_DOMAINS.items():
-                if bad in domain:
-                    print("[ALERT] Match:", domain, reason)
-                    insert_alert(
-                        conn,
-                        rule="Malicious website visited",
-                        severity="high",
-                        user=user,
-                        host=host,
-                        details=f"{domain} flagged: {reason}",
-                    )
-        except Exception as e:
-            print("[RULE ERROR]", e)
+def new_rows(conn, rule, sql, params=()):
+    """Yield (rows, last_id) chunks of rows with id > the rule's cursor.
+
+    sql must select id first and take (*params, last_id, limit) as parameters.
+    The caller advances the cursor with set_cursor() once a chunk is handled.
+    """
+    last_id = get_cursor(conn, rule)
+    while True:
+        rows = conn.execute(sql, (*params, last_id, RULE_BATCH)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows, last_id
+        if len(rows) < RULE_BATCH:
+            return
+
 
+def dsl_check(rule):
+    """Scheduler check function for a rule_dsl.SqlRule."""
+    def check(conn, alerts):
+        for rows, last_id in new_rows(conn, rule.name, rule.trigger_sql, rule.trigger_params):
+            for row in rows:
+                try:
+                    for alert in rule.evaluate(conn, row):
+                        alerts.add(**alert)
+                except (KeyError, ValueError, IndexError) as e:
+                    print(f"[RULE ERROR] {rule.name}: {e}")
+            alerts.advance(rule.name, last_id, len(rows))
+    check.__name__ = f"check_{rule.name}"
+    return check
 
-def check_brute_force(conn, window_min=5, threshold=5):
-    # multiple fails followed by success from same IP (T1110)
-    window_start = (datetime.utcnow() - timedelta(minutes=window_min)).isoformat()
-    cur = conn.cursor()
-    cur.execute(
+
+def load_schedule(path=DETECTIONS_PATH):
+    """name -> (check function, interval, timeout) for every rule in detections.json."""
+    return {
+        spec.name: (dsl_check(spec.sql()), spec.interval, spec.timeout)
+        for spec in default_rules(path)
+    }
+
+
+def advance_cursors(conn, rules):
+    """Mark every row ingested so far as evaluated (used by the streaming engine)."""
+    conn.executemany(
         """
-        SELECT ip
-        FROM logs
-        WHERE timestamp >= ? AND action='login' AND status='fail' AND ip IS NOT NULL
-        GROUP BY ip
-        HAVING COUNT(*) >= ?
+        INSERT INTO rule_state (rule, last_id)
+        SELECT ?, COALESCE(MAX(id), 0) FROM logs WHERE 1
+        ON CONFLICT(rule) DO UPDATE SET last_id=MAX(last_id, excluded.last_id)
         """,
-        (window_start, threshold),
+        [(rule,) for rule in rules],
     )
-    ips = [row[0] for row in cur.fetchall()]
-
-    for ip in ips:
-        cur.execute(
-            """
-            SELECT 1
-            FROM logs
-            WHERE ip=? AND action='login' AND status='success'
-              AND timestamp >= (
-                SELECT MAX(timestamp)
-                FROM logs
-                WHERE ip=? AND action='login' AND status='fail'
-              )
-            LIMIT 1
-            """,
-            (ip, ip),
-        )
-        if cur.fetchone():
-            insert_alert(
-                conn,
-                rule="Brute force then success (T1110)",
-                severity="high",
-                ip=ip,
-                details=f"Multiple failed logins followed by success from {ip}",
-            )
-
-
-def check_offhours_admin(conn, business_start=9, business_end=18):
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, timestamp, host, user, ip, rawjson
-        FROM logs
-        WHERE action = 'createuser'
-        """
-    )
-    rows = cur.fetchall()
-
-    for id_, ts, host, user, ip, rawjson in rows:
-        hour = int(ts[11:13])  # crude hour extraction from ISO timestamp
-        if not (business_start <= hour < business_end):
-            insert_alert(
-                conn,
-                rule="Admin created off-hours T1136",
-                severity="medium",
-                ip=ip,
-                user=user,
-                host=host,
-                details=f"User creation outside business hours at {ts}",
-            )
-
-
-def run_rules_loop(interval_seconds=30):
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    while True:
+
+
+def run_rules_once(conn, schedule=None):
+    """One pass of every rule; returns the ids of the alerts it wrote."""
+    alerts = AlertBuffer(conn)
+    for check, interval, timeout in (schedule or load_schedule()).values():
+        check(conn, alerts)
+    alerts.flush()
+    return alerts.ids
+
+
+# Scheduled mode (python rules.py): each rule runs on its own interval in a
+# thread pool and scans through its own read-only connection, so a slow
+# rule no longer holds up the others. Alert/cursor writes go through one
+# shared writer connection and are short. A run that outlives its timeout
+# is interrupted (rows already advanced over are kept); a rule still
+# running when it is due again counts an overrun and skips that slot.
+# Intervals and timeouts come from each rule's entry in detections.json.
+REPORT_INTERVAL = 30  # seconds between [RULES] stats lines
+
+RECORD_RUN_SQL = """
+    INSERT INTO rule_state (rule, last_id, runs, last_run, last_ms, max_ms, last_rows,
+                            rows_scanned, alerts, timeouts, overruns, errors)
+    VALUES (?, 0, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(rule) DO UPDATE SET
+        runs = runs + 1,
+        last_run = excluded.last_run,
+        last_ms = excluded.last_ms,
+        max_ms = MAX(COALESCE(max_ms, 0), excluded.max_ms),
+        last_rows = excluded.last_rows,
+        rows_scanned = rows_scanned + excluded.rows_scanned,
+        alerts = alerts + excluded.alerts,
+        timeouts = timeouts + excluded.timeouts,
+        overruns = overruns + excluded.overruns,
+        errors = errors + excluded.errors
+"""
+
+
+class RuleScheduler:
+    def __init__(self, schedule=None, db_path=DB_PATH, workers=None):
+        schedule = schedule or load_schedule()
+        self.schedule = schedule
+        self.db_path = db_path
+        self.writer = connect(db_path, check_same_thread=False)
+        self.write_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers or len(schedule), thread_name_prefix="rule")
+        self.local = threading.local()  # one read-only connection per pool thread
+        self.next_run = {name: 0.0 for name in schedule}
+        self.running = {}  # name -> Future
+        self.pending_overruns = {name: 0 for name in schedule}
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            name: {"runs": 0, "last_ms": 0.0, "max_ms": 0.0, "rows": 0, "alerts": 0,
+                   "timeouts": 0, "overruns": 0, "errors": 0}
+            for name in schedule
+        }
+
+    def _reader(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = connect_readonly(self.db_path)
+        return conn
+
+    def _run(self, name, check, timeout):
+        conn = self._reader()
+        deadline = time.monotonic() + timeout
+        # aborts a long-running query once the deadline has passed
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        alerts = AlertBuffer(self.writer, lock=self.write_lock, deadline=deadline)
+        timed_out = errored = 0
+        start = time.perf_counter()
         try:
-            check_brute_force(conn)
-            check_offhours_admin(conn)
-            check_malicious_sites(conn)   # 🔥 ADD
+            check(conn, alerts)
+        except (RuleTimeout, sqlite3.OperationalError) as e:
+            alerts.discard_partial()
+            if time.monotonic() <= deadline:
+                # a real error (locked database, missing table), not the deadline
+                errored = 1
+                print(f"[RULES ERROR] {name}: {e}")
+            else:
+                timed_out = 1
+                print(f"[RULES] {name} timed out after {timeout}s ({e.__class__.__name__})")
         except Exception as e:
-            print("[RULES ERROR]", e)
-        time.sleep(interval_seconds)
+            errored = 1
+            alerts.discard_partial()
+            print(f"[RULES ERROR] {name}: {e}")
+        finally:
+            conn.set_progress_handler(None, 0)
+        try:
+            alerts.flush()
+        except sqlite3.Error as e:
+            # nothing was committed, so the cursors stay put and the rows are redone next run
+            errored = 1
+            print(f"[RULES ERROR] {name}: writing alerts: {e}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record(name, elapsed_ms, alerts.scanned, len(alerts.ids), timed_out, errored)
+
+    def _record(self, name, elapsed_ms, rows, alerts, timed_out, errored):
+        with self.stats_lock:
+            s = self.stats[name]
+            s["runs"] += 1
+            s["last_ms"] = elapsed_ms
+            s["max_ms"] = max(s["max_ms"], elapsed_ms)
+            s["rows"] += rows
+            s["alerts"] += alerts
+            s["timeouts"] += timed_out
+            s["errors"] += errored
+            overruns, self.pending_overruns[name] = self.pending_overruns[name], 0
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        try:
+            with self.write_lock, write_transaction(self.writer):
+                self.writer.execute(RECORD_RUN_SQL, (
+                    name, now, elapsed_ms, elapsed_ms, rows, rows, alerts, timed_out, overruns, errored,
+                ))
+        except sqlite3.Error as e:
+            print(f"[RULES ERROR] recording {name} stats: {e}")
+
+    def tick(self):
+        """Start every rule that is due; returns seconds until the next one is."""
+        now = time.monotonic()
+        for name, (check, interval, timeout) in self.schedule.items():
+            if now < self.next_run[name]:
+                continue
+            self.next_run[name] = now + interval
+            running = self.running.get(name)
+            if running is not None and not running.done():
+                with self.stats_lock:
+                    self.stats[name]["overruns"] += 1
+                    self.pending_overruns[name] += 1
+                print(f"[RULES] {name} still running after its {interval}s interval; skipping this run")
+                continue
+            self.running[name] = self.pool.submit(self._run, name, check, timeout)
+        return max(0.0, min(self.next_run.values()) - time.monotonic())
+
+    def report(self):
+        with self.stats_lock:
+            for name, s in self.stats.items():
+                print(
+                    f"[RULES] {name}: runs={s['runs']} last={s['last_ms']:.1f}ms "
+                    f"max={s['max_ms']:.1f}ms rows_scanned={s['rows']} alerts={s['alerts']} "
+                    f"timeouts={s['timeouts']} overruns={s['overruns']} errors={s['errors']}"
+                )
+                s["max_ms"] = 0.0
+
+    def run_forever(self):
+        next_report = time.monotonic() + REPORT_INTERVAL
+        while True:
+            wait = self.tick()
+            if time.monotonic() >= next_report:
+                self.report()
+                lock_report("RULES")
+                prefilter_report("RULES")
+                SUPPRESSOR.report("RULES")
+                next_report = time.monotonic() + REPORT_INTERVAL
+            time.sleep(min(wait, 1.0))
+
+
+def run_rules_loop(schedule=None):
+    conn = connect(DB_PATH)
+    migrate(conn)
+    conn.close()
+    start_feed_watcher()
+    RuleScheduler(schedule).run_forever()
 
 if __name__ == "__main__":
     run_rules_loop()
@@ -0,0 +1,99 @@
+# sliding_window.py
+"""
+Keyed sliding-window counter for rate/threshold rules ("N failed logins
+from one IP within 5 minutes", "M file reads by one user per minute", ...).
+
+Each key gets a small ring of `buckets` counters, each covering
+window/buckets seconds, so add() and count() are O(buckets) no matter how
+many events arrive; the window is approximated to one bucket width.
+
+Keys are kept in least-recently-updated order:
+  - keys not updated for `ttl` seconds are dropped as time moves on
+  - at most `max_keys` keys are kept; the stalest one goes first
+
+Timestamps may be datetimes or epoch seconds, but use one kind per counter.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+
+
+def _seconds(ts):
+    return ts.timestamp() if isinstance(ts, datetime) else ts
+
+
+class _Ring:
+    __slots__ = ("counts", "epochs", "last_seen")
+
+    def __init__(self, buckets):
+        self.counts = [0] * buckets
+        self.epochs = [-1] * buckets
+        self.last_seen = 0.0
+
+
+class SlidingWindowCounter:
+    def __init__(self, window_seconds, buckets=30, ttl=None, max_keys=100000):
+        self.window = float(window_seconds)
+        self.buckets = buckets
+        self.width = self.window / buckets
+        self.ttl = float(ttl) if ttl is not None else self.window
+        self.max_keys = max_keys
+        self.keys = OrderedDict()  # key -> _Ring, least recently updated first
+        self.stats = {"evicted_ttl": 0, "evicted_cap": 0}
+
+    def add(self, key, ts, n=1):
+        """Count n events for key at ts; returns the key's count in the window ending at ts."""
+        now = _seconds(ts)
+        self.evict(now)
+        ring = self.keys.get(key)
+        if ring is None:
+            ring = self.keys[key] = _Ring(self.buckets)
+            while len(self.keys) > self.max_keys:
+                self.keys.popitem(last=False)
+                self.stats["evicted_cap"] += 1
+        else:
+            self.keys.move_to_end(key)
+        if now > ring.last_seen:
+            ring.last_seen = now
+
+        epoch = int(now // self.width)
+        slot = epoch % self.buckets
+        if ring.epochs[slot] != epoch:
+            if ring.epochs[slot] > epoch:
+                # older than anything this slot now holds; outside the window
+                return self._sum(ring, int(ring.last_seen // self.width))
+            ring.epochs[slot] = epoch
+            ring.counts[slot] = 0
+        ring.counts[slot] += n
+        return self._sum(ring, epoch)
+
+    def count(self, key, ts):
+        """Events for key in the window ending at ts."""
+        ring = self.keys.get(key)
+        if ring is None:
+            return 0
+        return self._sum(ring, int(_seconds(ts) // self.width))
+
+    def _sum(self, ring, epoch):
+        oldest = epoch - self.buckets
+        return sum(c for c, e in zip(ring.counts, ring.epochs) if oldest < e <= epoch)
+
+    def reset(self, key):
+        self.keys.pop(key, None)
+
+    def evict(self, now):
+        """Drop keys whose last update is more than ttl seconds before now."""
+        cutoff = _seconds(now) - self.ttl
+        keys = self.keys
+        while keys:
+            key, ring = next(iter(keys.items()))
+            if ring.last_seen >= cutoff:
+                break
+            del keys[key]
+            self.stats["evicted_ttl"] += 1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
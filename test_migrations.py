@@ -0,0 +1,28 @@
+# test_migrations.py
+"""
+python -m pytest -q
+
+Migrates a fresh database and checks that every rule and dashboard query
+is still answered from an index (same check as migrations.py --check-plans).
+"""
+
+from db import connect
+from migrations import MIGRATIONS, QUERY_PLAN_CHECKS, check_query_plans, current_version, migrate, rule_plan_checks
+
+
+def test_migrate_fresh_db(tmp_path):
+    conn = connect(str(tmp_path / "logs.db"))
+    try:
+        assert migrate(conn, verbose=False) == MIGRATIONS[-1][0]
+        assert migrate(conn, verbose=False) == current_version(conn)  # re-running is a no-op
+    finally:
+        conn.close()
+
+
+def test_query_plans_use_indexes(tmp_path):
+    conn = connect(str(tmp_path / "logs.db"))
+    try:
+        migrate(conn, verbose=False)
+        assert check_query_plans(conn, QUERY_PLAN_CHECKS + rule_plan_checks()) == []
+    finally:
+        conn.close()
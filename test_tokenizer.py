@@ -0,0 +1,39 @@
+# test_tokenizer.py
+"""
+python -m pytest -q
+
+tokenizer.parse_fields against the lines the agents send, including
+quoted values and quotes an attacker can put in a page title.
+"""
+
+from tokenizer import parse_fields, tokenize
+
+
+def test_plain_line():
+    pri, timestamp, hostname, fields = tokenize(
+        "<13>2026-02-04T09:44:43 localhost chrome host=PC user=bob action=browse status=success")
+    assert (pri, timestamp, hostname) == (13, "2026-02-04T09:44:43", "localhost")
+    assert fields == {"host": "PC", "user": "bob", "action": "browse", "status": "success"}
+
+
+def test_quoted_value():
+    fields = parse_fields('user=bob path="C:\\My Docs\\a.txt" access=read action=file_access status=success')
+    assert fields["path"] == "C:\\My Docs\\a.txt"
+    assert fields["action"] == "file_access"
+    assert fields["status"] == "success"
+
+
+def test_unbalanced_quote_in_title():
+    # a stray '"' must not swallow the fields after it
+    fields = parse_fields('url=https://evil.example/ title=27" Monitor deals action=browse status=success')
+    assert fields == {"url": "https://evil.example/", "title": '27"', "action": "browse", "status": "success"}
+
+
+def test_stray_quote_before_quoted_value():
+    fields = parse_fields('title=27" Monitor path="C:\\a b.txt" action=file_access')
+    assert fields == {"title": '27"', "path": "C:\\a b.txt", "action": "file_access"}
+
+
+def test_quote_inside_url():
+    fields = parse_fields('url=https://e.example/?q="x" action=browse')
+    assert fields == {"url": 'https://e.example/?q="x"', "action": "browse"}
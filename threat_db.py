@@ -1,3 +1,7 @@
+from domain_matcher import DomainMatcher
+from threat_intel import FEED_POLL_SECONDS, ThreatIntel
+
+# built-in indicators; larger lists go in feed files (see threat_intel.py)
 SUSPICIOUS_DOMAINS = {
     "malware.com": "Known malware host",
     "phishingsite.com": "Phishing page",
@@ -6,4 +10,98 @@ SUSPICIOUS_DOMAINS = {
     "torrentz2.io": "Copyright abuse",
     "cracksoft.org": "Illegal software",
     "https://chatgpt.com/": "TEST: flagged for demo", 
-}
\ No newline at end of file
+}
+
+# compiled once; reload() builds a replacement off to the side and swaps the
+# reference, so lookups in other threads see either the old feed or the new one
+MATCHER = DomainMatcher(SUSPICIOUS_DOMAINS)
+
+
+def reload(indicators):
+    """Replace the active indicator set with {indicator: reason}."""
+    global MATCHER
+    MATCHER = DomainMatcher(indicators)
+    return MATCHER
+
+
+def _on_feed_reload(index):
+    # feed domains are looked up in the mmap index; URL indicators need the automaton
+    reload({**index.urls, **SUSPICIOUS_DOMAINS})
+
+
+INTEL = ThreatIntel(on_reload=_on_feed_reload)
+
+
+def start_feed_watcher(interval=FEED_POLL_SECONDS):
+    """Load the feed index and keep it current from a background thread."""
+    INTEL.start(interval)
+
+
+# Almost every browsed domain is clean, so match_domain() first checks the
+# domain and its parents against the built-in domains and the feed's Bloom
+# filter; only "maybe" answers go on to the exact domain lookups (trie and
+# mmap index). URL indicators can match anywhere in the URL, so the
+# automaton always runs; the prefilter never decides those.
+#   hits: passed the prefilter, misses: rejected by it,
+#   false_positives: passed but nothing matched
+PREFILTER_STATS = {"hits": 0, "misses": 0, "false_positives": 0}
+
+
+def might_match(domain, matcher=None):
+    """False if no domain indicator can match domain or a parent; True means "look it up"."""
+    hosts = (matcher or MATCHER).hosts
+    pos = 0
+    while True:
+        if domain[pos:] in hosts:
+            return True
+        pos = domain.find(".", pos) + 1
+        if not pos:
+            break
+    index = INTEL.index
+    if index is None or not index.n_domains:
+        return False
+    labels = domain.split(".")
+    labels.reverse()
+    return index.bloom.any_prefix(labels)
+
+
+def match_domain(domain, url=None):
+    """Return [(indicator, reason)] for every entry matching domain (or its full url)."""
+    domain = (domain or "").lower().rstrip(".")
+    matcher = MATCHER
+    stats = PREFILTER_STATS
+    hits = []
+    if domain:
+        if might_match(domain, matcher):
+            stats["hits"] += 1
+            hits = matcher.domains.match(domain)
+            for hit in INTEL.match_domain(domain):
+                if hit[0] not in SUSPICIOUS_DOMAINS:
+                    hits.append(hit)
+            if not hits:
+                stats["false_positives"] += 1
+        else:
+            stats["misses"] += 1
+    hits.extend(matcher.match_url(domain, url, hits))
+    return hits
+
+
+def prefilter_report(tag):
+    s = PREFILTER_STATS
+    checked = s["hits"] + s["misses"]
+    if not checked:
+        return
+    print(
+        f"[{tag}] threat prefilter: checked={checked} rejected={s['misses']} "
+        f"passed={s['hits']} false_positives={s['false_positives']}"
+    )
+
+
+def match_ip(ip):
+    """Return [(range, reason)] if ip is in a feed's address/CIDR list."""
+    return INTEL.match_ip(ip)
+
+
+def match_hash(value):
+    """Return [(hash, reason)] if value is a feed-listed md5/sha1/sha256."""
+    return INTEL.match_hash(value)
@@ -0,0 +1,128 @@
+# tokenizer.py
+"""
+Single-pass tokenizer for the agents' syslog lines:
+
+    <13>2026-02-04T09:44:43 localhost chrome host=PC user=bob url=... action=browse status=success
+    <13>2026-02-04T09:44:43 localhost file user=bob path="C:\\My Docs\\a.txt" access=read ...
+
+The header (PRI, timestamp, hostname) is sliced off with str.find and the
+body is split once into tokens; each key=value token is cut with
+str.partition. All of the scanning happens inside C string methods, which
+is what makes this faster than FIELD_RE.findall() + dict() in CPython.
+Lines containing '"' take a quote-aware path so values like
+path="C:\\My Docs\\a.txt" come back whole and without their quotes.
+
+Common keys are looked up in a fixed table (so every event shares the same
+key objects), and the values of action, status and access are interned.
+host, user and ip values are not: they come off the network with no bound
+on how many distinct ones there are, and from Python 3.12 on interned
+strings are never freed.
+"""
+
+import sys
+
+COMMON_KEYS = {
+    k: sys.intern(k)
+    for k in ("host", "user", "action", "status", "ip", "url", "title", "path", "access")
+}
+# values worth interning: a handful of distinct values, repeated on every event
+INTERN_VALUES = frozenset(("action", "status", "access"))
+
+_intern = sys.intern
+
+
+def parse_header(line: str):
+    """Return (pri, timestamp, hostname, body_start) for "<PRI>TIMESTAMP HOSTNAME ...".
+
+    Missing parts come back as None; body_start is where key=value
+    scanning should begin.
+    """
+    if not line.startswith("<"):
+        return None, None, None, 0
+    gt = line.find(">", 1, 6)
+    if gt == -1 or not line[1:gt].isdigit():
+        return None, None, None, 0
+    pri = int(line[1:gt])
+
+    ts_end = line.find(" ", gt + 1)
+    if ts_end == -1 or not line[gt + 1:gt + 2].isdigit():
+        # "<13>auth user=..." - no timestamp in this header
+        return pri, None, None, gt + 1
+    timestamp = line[gt + 1:ts_end]
+
+    host_end = line.find(" ", ts_end + 1)
+    if host_end == -1:
+        host_end = len(line)
+    hostname = line[ts_end + 1:host_end]
+    if "=" in hostname:
+        return pri, timestamp, None, ts_end + 1
+    return pri, timestamp, hostname, host_end + 1
+
+
+def _add(fields, k, v):
+    key = COMMON_KEYS.get(k)
+    if key is None:
+        # same key syntax FIELD_RE accepted: \w+
+        if not k.isidentifier() and not k.isalnum():
+            return
+        key = k
+    elif key in INTERN_VALUES:
+        v = _intern(v)
+    fields[key] = v
+
+
+def _add_tokens(fields, tokens):
+    for tok in tokens:
+        k, sep, v = tok.partition("=")
+        if sep and k:
+            _add(fields, k, v)
+
+
+def parse_fields(body: str) -> dict:
+    """Collect key=value pairs; words without '=' are skipped."""
+    fields = {}
+    if '"' not in body:
+        # fast path: inlined _add_tokens
+        common = COMMON_KEYS
+        for tok in body.split():
+            k, sep, v = tok.partition("=")
+            if not sep or not k:
+                continue
+            key = common.get(k)
+            if key is None:
+                if not k.isidentifier() and not k.isalnum():
+                    continue
+                key = k
+            elif key in INTERN_VALUES:
+                v = _intern(v)
+            fields[key] = v
+        return fields
+
+    # key="value with spaces" is quoted only when its closing quote exists;
+    # a stray '"' (title=27" Monitor) is just part of a whitespace token
+    pos = search = 0
+    while True:
+        q = body.find('="', search)
+        if q == -1:
+            break
+        close = body.find('"', q + 2)
+        if close == -1:
+            break
+        head = body[pos:q]
+        tokens = head.split()
+        key = tokens[-1] if tokens and not head[-1].isspace() else ""
+        if not key.isidentifier() and not key.isalnum():
+            search = q + 2  # '="' inside a value, e.g. url=...?q="x"
+            continue
+        tokens.pop()
+        _add_tokens(fields, tokens)
+        _add(fields, key, body[q + 2:close])
+        pos = search = close + 1
+    _add_tokens(fields, body[pos:].split())
+    return fields
+
+
+def tokenize(line: str):
+    """Return (pri, timestamp, hostname, fields) for one syslog line."""
+    pri, timestamp, hostname, body = parse_header(line)
+    return pri, timestamp, hostname, parse_fields(line[body:] if body else line)